@@ -0,0 +1,263 @@
+import asyncio, logging, json, os, time
+
+import aiohttp
+
+from .config import CONFIG
+from .cache import TTLCache
+from . import ratelimit
+from .ratelimit import INTERACTIVE, BACKGROUND
+
+"""Shared HTTP client for the Hypixel and Mojang APIs. Every cog goes through
+this module so requests reuse pooled keep-alive connections and never block
+the event loop."""
+
+HYPIXEL_URL = "https://api.hypixel.net"
+MOJANG_BULK_URL = "https://api.minecraftservices.com/minecraft/profile/lookup/bulk/byname"
+
+_session = None
+
+"""Raw /player documents keyed by undashed UUID. One document holds every
+gamemode, so Bedwars, Bridge and UHC lookups for the same player share it."""
+_players = None
+_inflight = {}
+
+_scheduler = None
+
+# Hypixel staff member used to check that the API key works
+KEY_CHECK_UUID = "f7c77d999f154a66a87dc4a51ef30d19"
+
+# How many times a request that got a 429 is queued again before giving up
+MAX_RETRIES = 3
+
+"""Lowercase username -> (undashed UUID or None for unknown names, expiry as a unix timestamp).
+Persisted to data/uuidcache.json so it survives restarts."""
+_names = {}
+_names_path = None
+_pending_names = {}
+_names_flush = None
+_names_save_lock = asyncio.Lock()
+
+# Mojang's bulk endpoint accepts at most this many names per request
+MOJANG_BATCH_SIZE = 10
+# How long to wait for more names to join a batch before sending it
+MOJANG_BATCH_WINDOW = 0.05
+
+
+class APIError(Exception):
+  """Raised when an API request does not return a usable response."""
+  def __init__(self, status, message=""):
+    super().__init__(f"API request failed with status {status}. {message}".strip())
+    self.status = status
+
+
+def get_session() -> aiohttp.ClientSession:
+  """Returns the shared client session, creating it on first use. Must be called from a running event loop."""
+  global _session
+
+  if _session is None or _session.closed:
+    connector = aiohttp.TCPConnector(limit=CONFIG.HTTP_POOL_SIZE, keepalive_timeout=30, ttl_dns_cache=300)
+    timeout = aiohttp.ClientTimeout(total=CONFIG.REQUEST_TIMEOUT)
+    _session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+  return _session
+
+async def close():
+  """Closes the shared session. Safe to call if it was never opened."""
+  global _session
+
+  if _session is not None and not _session.closed:
+    await _session.close()
+  _session = None
+
+async def _request(url, params=None, headers=None, timeout=None, method="GET", json=None):
+  """Returns the status, headers and decoded JSON body (the text if the request failed) of a request."""
+  session = get_session()
+  timeout = aiohttp.ClientTimeout(total=timeout) if timeout is not None else None
+
+  logging.debug(f"Making web request to {url}")
+  async with session.request(method, url, params=params, headers=headers, timeout=timeout, json=json) as response:
+    if response.status != 200:
+      return response.status, response.headers, await response.text()
+    return response.status, response.headers, await response.json(content_type=None)
+
+def scheduler() -> ratelimit.RequestScheduler:
+  """Returns the scheduler that every Hypixel request waits on."""
+  global _scheduler
+
+  if _scheduler is None:
+    _scheduler = ratelimit.RequestScheduler(CONFIG.RATE_LIMIT, CONFIG.RATE_LIMIT_WINDOW)
+  return _scheduler
+
+async def _hypixel_get(path, params, timeout=None, priority=INTERACTIVE):
+  """Makes a rate limited request to the Hypixel API, queueing it again if Hypixel answers 429."""
+  if CONFIG.KEY_VALID is False:
+    raise APIError(403, "The configured API key was rejected by Hypixel.")
+
+  sched = scheduler()
+
+  for attempt in range(MAX_RETRIES + 1):
+    await sched.acquire(priority)
+    try:
+      status, headers, body = await _request(f"{HYPIXEL_URL}/{path}", params=params, headers={"API-Key": CONFIG.KEY}, timeout=timeout)
+    except BaseException:
+      sched.release()
+      raise
+    sched.release(headers)
+
+    if status == 429:
+      retry_after = ratelimit.header_int(headers, "Retry-After")
+      if retry_after is None:
+        retry_after = ratelimit.header_int(headers, "RateLimit-Reset")
+      logging.warning(f"Hypixel rate limit hit on /{path}. Retrying in {retry_after}s (attempt {attempt + 1}).")
+      sched.throttle(retry_after)
+      continue
+
+    if status == 403:
+      CONFIG.KEY_VALID = False
+    if status != 200:
+      raise APIError(status, body)
+    return body
+
+  raise APIError(429, "Rate limit retries exhausted.")
+
+async def check_key():
+  """Returns True if Hypixel accepts the API key, False if it rejects it and None if the check was inconclusive."""
+  sched = scheduler()
+
+  await sched.acquire(BACKGROUND)
+  try:
+    status, headers, _ = await _request(f"{HYPIXEL_URL}/player", params={"uuid": KEY_CHECK_UUID}, headers={"API-Key": CONFIG.KEY})
+  except BaseException:
+    sched.release()
+    raise
+  sched.release(headers)
+
+  if status == 200:
+    return True
+  if status == 403:
+    return False
+  return None
+
+def player_cache() -> TTLCache:
+  global _players
+
+  if _players is None:
+    _players = TTLCache(CONFIG.PLAYER_CACHE_SIZE, CONFIG.PLAYER_CACHE_TTL)
+  return _players
+
+async def _fetch_player(uuid, timeout, priority):
+  data = await _hypixel_get("player", {"uuid": uuid}, timeout=timeout, priority=priority)
+
+  if data.get("success") is True:
+    player_cache().set(uuid, data)
+  return data
+
+async def fetch_player(uuid: str, timeout=None, fresh=False, priority=INTERACTIVE) -> dict:
+  """
+  Fetches the raw /player document for a UUID. Documents are cached for PLAYER_CACHE_TTL seconds
+  and concurrent calls for the same UUID share a single request. The returned dict is shared
+  between callers and must not be modified. Pass fresh=True to skip the cache, and
+  priority=BACKGROUND for polling that should yield to slash commands.
+  """
+  uuid = uuid.replace("-", "").lower()
+
+  if not fresh:
+    cached = player_cache().get(uuid)
+    if cached is not None:
+      return cached
+
+  task = _inflight.get(uuid)
+  if task is None:
+    task = asyncio.ensure_future(_fetch_player(uuid, timeout, priority))
+    _inflight[uuid] = task
+    task.add_done_callback(lambda _: _inflight.pop(uuid, None))
+
+  # Shield so one caller being cancelled does not cancel the fetch for everyone else
+  return await asyncio.shield(task)
+
+def load_uuid_cache(dir):
+  """Loads the persisted username -> UUID cache, dropping expired entries."""
+  global _names_path
+
+  _names_path = os.path.join(dir, "data", "uuidcache.json")
+  if not os.path.exists(_names_path):
+    return
+
+  try:
+    with open(_names_path, "r") as f:
+      entries = json.load(f)
+  except (OSError, ValueError) as e:
+    logging.error(f"Could not read {_names_path}, starting with an empty UUID cache: {e}")
+    return
+
+  now = time.time()
+  _names.update({name: (uuid, expires) for name, (uuid, expires) in entries.items() if expires > now})
+  logging.info(f"Loaded {len(_names)} cached UUIDs.")
+
+def _save_uuid_cache(entries):
+  tmp_path = _names_path + ".tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(entries, f)
+  os.replace(tmp_path, _names_path)
+
+async def _flush_names():
+  global _names_flush
+  _names_flush = None
+
+  while _pending_names:
+    batch = dict(list(_pending_names.items())[:MOJANG_BATCH_SIZE])
+    for name in batch:
+      del _pending_names[name]
+
+    try:
+      status, _, body = await _request(MOJANG_BULK_URL, method="POST", json=list(batch))
+      if status != 200:
+        raise APIError(status, body)
+    except Exception as e:
+      for future in batch.values():
+        if not future.done():
+          future.set_exception(e)
+      continue
+
+    found = {profile["name"].lower(): profile["id"] for profile in body}
+    now = time.time()
+    for name, future in batch.items():
+      uuid = found.get(name)
+      _names[name] = (uuid, now + (CONFIG.UUID_CACHE_TTL if uuid is not None else CONFIG.UUID_NEGATIVE_TTL))
+      if not future.done():
+        future.set_result(uuid)
+
+  if _names_path is not None:
+    async with _names_save_lock:
+      try:
+        await asyncio.to_thread(_save_uuid_cache, dict(_names))
+      except OSError as e:
+        logging.error(f"Could not save UUID cache to {_names_path}: {e}")
+
+async def fetch_uuid(name: str):
+  """
+  Resolves a Minecraft username to an undashed UUID. Returns None if the name does not exist.
+  Results, including unknown names, are cached, and names requested at the same time are
+  looked up together through Mojang's bulk endpoint.
+  """
+  global _names_flush
+  name = name.lower()
+
+  cached = _names.get(name)
+  if cached is not None and cached[1] > time.time():
+    return cached[0]
+
+  future = _pending_names.get(name)
+  if future is None:
+    future = asyncio.get_running_loop().create_future()
+    _pending_names[name] = future
+
+    if len(_pending_names) >= MOJANG_BATCH_SIZE:
+      if _names_flush is not None:
+        _names_flush.cancel()
+      _names_flush = None
+      asyncio.ensure_future(_flush_names())
+    elif _names_flush is None:
+      _names_flush = asyncio.get_running_loop().call_later(MOJANG_BATCH_WINDOW, lambda: asyncio.ensure_future(_flush_names()))
+
+  return await asyncio.shield(future)
@@ -0,0 +1,97 @@
+"""
+Compares bytes on disk and read latency of plain and zstd compressed snapshots. Uses a copy of a
+tracked player's history, so the real data is never modified.
+
+  python benchmarks/snapshots.py [--player UUID] [--storage full|delta] [--synthetic DAYS]
+
+With --synthetic, a generated history is used instead of real data.
+"""
+import argparse, copy, datetime, importlib.util, os, random, shutil, statistics, sys, tempfile, time
+
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1].absolute()
+
+
+def load_package():
+  spec = importlib.util.spec_from_file_location("sprocket_hypixel", ROOT / "__init__.py", submodule_search_locations=[str(ROOT)])
+  package = importlib.util.module_from_spec(spec)
+  sys.modules["sprocket_hypixel"] = package
+  spec.loader.exec_module(package)
+
+def synthetic_history(directory, uuid, days, snapshots):
+  random.seed(0)
+  counters = {f"{mode}_{stat}_bedwars": random.randint(0, 10**5) for mode in ["eight_one", "eight_two", "four_three", "four_four"] for stat in range(60)}
+  doc = {"success": True, "player": {"displayname": "Benchmark", "achievements": {"bedwars_level": 100}, "stats": {"Bedwars": counters, "Duels": dict(counters)}}}
+
+  start = datetime.datetime(2024, 1, 1)
+  for day in range(days):
+    doc = copy.deepcopy(doc)
+    for _ in range(30):
+      key = random.choice(list(counters))
+      doc["player"]["stats"]["Bedwars"][key] += random.randint(1, 20)
+    snapshots.write_snapshot(directory, uuid, start + datetime.timedelta(days=day), doc, storage="full", compress=False)
+
+def directory_size(path):
+  return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def measure(directory, uuid, snapshots):
+  wkdir = snapshots.player_dir(directory, uuid)
+  dates = snapshots.list_dates(wkdir)
+
+  latencies = []
+  for date_str in dates:
+    start = time.perf_counter()
+    snapshots.read_snapshot(directory, uuid, date_str)
+    latencies.append(time.perf_counter() - start)
+
+  start = time.perf_counter()
+  for _ in snapshots.iter_snapshots(directory, uuid):
+    pass
+  scan = time.perf_counter() - start
+
+  return directory_size(wkdir), statistics.median(latencies), scan, len(dates)
+
+def main():
+  args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  args.add_argument("--player", default=None)
+  args.add_argument("--storage", choices=["full", "delta"], default="full")
+  args.add_argument("--synthetic", type=int, default=None, metavar="DAYS")
+  args = args.parse_args()
+
+  load_package()
+  from sprocket_hypixel.tracking import snapshots
+
+  directory = tempfile.mkdtemp(prefix="sprocket-hypixel-bench-")
+  try:
+    if args.synthetic is not None:
+      uuid = "synthetic"
+      synthetic_history(directory, uuid, args.synthetic, snapshots)
+    else:
+      uuid = args.player
+      if uuid is None:
+        with open(ROOT / "data" / "trackedplayers.txt", "r") as f:
+          uuid = f.readline().strip()
+      shutil.copytree(snapshots.player_dir(str(ROOT), uuid), snapshots.player_dir(directory, uuid))
+
+    results = []
+
+    snapshots.rewrite_history(directory, uuid, storage=args.storage, compress=False)
+    results.append(("plain", *measure(directory, uuid, snapshots)))
+
+    snapshots.rewrite_history(directory, uuid, storage=args.storage, compress=True)
+    results.append(("zstd", *measure(directory, uuid, snapshots)))
+
+    snapshots.train_dictionary(directory, [uuid])
+    snapshots.rewrite_history(directory, uuid, storage=args.storage, compress=True)
+    results.append(("zstd+dictionary", *measure(directory, uuid, snapshots)))
+
+    print(f"{results[0][4]} snapshots stored as {args.storage}")
+    print(f"{'format':>16} {'bytes':>12} {'ratio':>7} {'median read':>12} {'full scan':>10}")
+    for name, size, latency, scan, _ in results:
+      print(f"{name:>16} {size:>12} {results[0][1] / size:>6.1f}x {latency * 1000:>9.2f} ms {scan * 1000:>7.1f} ms")
+  finally:
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,89 @@
+"""
+Measures how long it takes to import sprocket-hypixel and build its cogs, the work Sprocket
+does before printing "Loaded cogs". Every sample runs in a fresh interpreter so imports are cold.
+
+  python benchmarks/startup.py [--runs 10] [--tracking] [--budget SECONDS]
+
+Exits with status 1 if the median exceeds --budget, or if pandas, matplotlib or dateutil were
+imported while tracking is disabled.
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1].absolute()
+HEAVY_MODULES = ["pandas", "matplotlib", "dateutil"]
+
+
+def child(directory):
+  import importlib.util
+
+  start = time.perf_counter()
+
+  spec = importlib.util.spec_from_file_location("sprocket_hypixel", ROOT / "__init__.py", submodule_search_locations=[str(ROOT)])
+  package = importlib.util.module_from_spec(spec)
+  sys.modules["sprocket_hypixel"] = package
+  spec.loader.exec_module(package)
+
+  from sprocket_hypixel import hypixel
+  from discord.ext import commands
+  imported = time.perf_counter()
+
+  client = commands.Bot(intents=hypixel.get_intents())
+  cogs = hypixel.get_cogs(client, directory)
+  done = time.perf_counter()
+
+  print(json.dumps({
+    "import": imported - start,
+    "get_cogs": done - imported,
+    "total": done - start,
+    "cogs": len(cogs),
+    "heavy": [name for name in HEAVY_MODULES if name in sys.modules]
+  }))
+
+def make_directory(tracking):
+  directory = tempfile.mkdtemp(prefix="sprocket-hypixel-bench-")
+  os.mkdir(os.path.join(directory, "data"))
+
+  with open(os.path.join(directory, "config.toml"), "w") as f:
+    f.write(f'tracking = {"true" if tracking else "false"}\napi_key = "benchmark"\n')
+
+  return directory
+
+def main():
+  args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  args.add_argument("--runs", type=int, default=10)
+  args.add_argument("--tracking", action="store_true", help="Benchmark with tracking enabled.")
+  args.add_argument("--budget", type=float, default=None, help="Fail if the median total time exceeds this many seconds.")
+  args.add_argument("--child", help=argparse.SUPPRESS)
+  args = args.parse_args()
+
+  if args.child is not None:
+    child(args.child)
+    return
+
+  directory = make_directory(args.tracking)
+  samples = []
+  for _ in range(args.runs):
+    output = subprocess.run([sys.executable, __file__, "--child", directory], capture_output=True, text=True, check=True)
+    samples.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+  for key in ["import", "get_cogs", "total"]:
+    values = [sample[key] * 1000 for sample in samples]
+    print(f"{key:>9}: median {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+  heavy = sorted(set(name for sample in samples for name in sample["heavy"]))
+  print(f"    heavy: {', '.join(heavy) if heavy else 'none'}")
+
+  failed = False
+  if not args.tracking and heavy:
+    print(f"Heavy modules were imported with tracking disabled: {', '.join(heavy)}")
+    failed = True
+  if args.budget is not None and statistics.median(sample["total"] for sample in samples) > args.budget:
+    print(f"Median startup time is over the {args.budget}s budget.")
+    failed = True
+
+  sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+  main()
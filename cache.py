@@ -0,0 +1,105 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache():
+  """A least-recently-used mapping whose entries also expire `ttl` seconds after they were stored."""
+  def __init__(self, maxsize: int, ttl: float):
+    self.maxsize = maxsize
+    self.ttl     = ttl
+    self._data   = OrderedDict()
+
+  def get(self, key, default=None):
+    entry = self._data.get(key)
+    if entry is None:
+      return default
+
+    expires, value = entry
+    if expires <= time.monotonic():
+      del self._data[key]
+      return default
+
+    self._data.move_to_end(key)
+    return value
+
+  def set(self, key, value):
+    self._data[key] = (time.monotonic() + self.ttl, value)
+    self._data.move_to_end(key)
+
+    while len(self._data) > self.maxsize:
+      self._data.popitem(last=False)
+
+  def pop(self, key, default=None):
+    entry = self._data.pop(key, None)
+    return default if entry is None else entry[1]
+
+  def clear(self):
+    self._data.clear()
+
+  def __contains__(self, key):
+    return self.get(key) is not None
+
+  def __len__(self):
+    return len(self._data)
+
+
+class SizedLRUCache():
+  """
+  A least-recently-used mapping that evicts entries once their total size is over `budget` bytes.
+  Entries can carry a version, and reading one with a different version drops it, so values built
+  from a file can be keyed by what they are and checked against the file's current state.
+  """
+  def __init__(self, budget: int):
+    self.budget    = budget
+    self.size      = 0
+    self.hits      = 0
+    self.misses    = 0
+    self.evictions = 0
+    self._data     = OrderedDict()
+
+  def get(self, key, version=None, default=None):
+    entry = self._data.get(key)
+    if entry is None or entry[0] != version:
+      if entry is not None:
+        self.pop(key)
+      self.misses += 1
+      return default
+
+    self._data.move_to_end(key)
+    self.hits += 1
+    return entry[1]
+
+  def set(self, key, value, size: int, version=None):
+    self.pop(key)
+    # A value bigger than the whole budget would only evict everything else
+    if size > self.budget:
+      return
+
+    self._data[key] = (version, value, size)
+    self.size += size
+
+    while self.size > self.budget:
+      _, (_, _, evicted) = self._data.popitem(last=False)
+      self.size -= evicted
+      self.evictions += 1
+
+  def pop(self, key, default=None):
+    entry = self._data.pop(key, None)
+    if entry is None:
+      return default
+
+    self.size -= entry[2]
+    return entry[1]
+
+  def clear(self):
+    self._data.clear()
+    self.size = 0
+
+  def stats(self) -> dict:
+    return {"entries": len(self._data), "bytes": self.size, "budget": self.budget, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+  def __contains__(self, key):
+    return key in self._data
+
+  def __len__(self):
+    return len(self._data)
@@ -1,14 +1,61 @@
-import dataclasses
+import dataclasses, os
 import discord
 
 both_in = {discord.IntegrationType.user_install, discord.IntegrationType.guild_install}
 guild_in = {discord.IntegrationType.guild_install}
 
+def default_workers(cap: int) -> int:
+  """
+  Returns how many worker processes to start when a pool's setting is 0: the CPUs this process may
+  run on, at most cap. os.cpu_count() counts every CPU of the host, which in a container can be
+  far more than it is allowed to use.
+  """
+  try:
+    cpus = len(os.sched_getaffinity(0))
+  except AttributeError:
+    # Not available on macOS or Windows
+    cpus = os.cpu_count() or 1
+  return max(1, min(cpus, cap))
+
+def fork_context():
+  """
+  Returns the multiprocessing context worker pools are created with, or None where processes
+  can't be forked (Windows). The package is loaded by path rather than installed, so workers
+  started any other way can't import it to unpickle their work, and pools fall back to threads.
+  """
+  import multiprocessing
+
+  if "fork" not in multiprocessing.get_all_start_methods():
+    return None
+  return multiprocessing.get_context("fork")
+
 @dataclasses.dataclass
 class GlobalConfig:
   TRACKING_ENABLED = False
   PATH = None
   KEY = None
+  KEY_VALID = None
+  KEY_CHECK_INTERVAL = 24 * 60 * 60
   ALLOW_USER_INSTALLS = True
+  REQUEST_TIMEOUT = 10
+  HTTP_POOL_SIZE = 20
+  PLAYER_CACHE_TTL = 60
+  PLAYER_CACHE_SIZE = 512
+  RATE_LIMIT = 300
+  RATE_LIMIT_WINDOW = 300
+  UUID_CACHE_TTL = 7 * 24 * 60 * 60
+  UUID_NEGATIVE_TTL = 60 * 60
+  UPDATER_CONCURRENCY = 8
+  SNAPSHOT_STORAGE = "delta"
+  KEYFRAME_INTERVAL = 7
+  COMPRESS_SNAPSHOTS = False
+  SNAPSHOT_PROJECTION = ["success", "player.displayname", "player.achievements.bedwars_level", "player.stats.Bedwars", "player.stats.Duels"]
+  RAW_RETENTION_DAYS = 0
+  REBUILD_WORKERS = 0
+  REBUILD_HOUR = 6
+  GRAPH_POINTS = 400
+  FRAME_CACHE_MB = 256
+  GRAPH_WORKERS = 0
+  GRAPH_CACHE_MB = 64
 
 CONFIG = GlobalConfig()
\ No newline at end of file
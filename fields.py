@@ -0,0 +1,348 @@
+"""Registry of the stats each mode reads from a Hypixel player document.
+
+Every mode is a list of fields:
+
+  Field(name, path)                  a single value, e.g. "player.stats.Bedwars.kills_bedwars"
+  Sum(name, container, prefixes, s)  <prefix>_<s> summed over submodes inside container
+  Total(name, columns)               the sum of other columns of the mode
+  Ratio(name, numerator, denom)      one column divided by another, 0 when the denominator is 0
+
+The registry is compiled into one Extractor, which looks up each container (e.g.
+player.stats.Duels) once per document and fills the columns of every mode from it, so
+adding a mode only means adding its fields here. Fields with stored=False are used by
+the live commands but left out of the tracked stat tables.
+
+Duels modes are not tracked in tables of their own. Every counter under
+player.stats.Duels is stored as a column of one wide "duels" table (see duels_counters),
+and a duel mode's columns are computed from it with aggregate, so any mode in the
+registry can be graphed from the same table."""
+
+DUELS = "player.stats.Duels"
+
+BRIDGE_MODES = ["bridge_duel", "bridge_doubles", "bridge_threes", "bridge_four", "bridge_3v3v3v3"]
+
+"""Bedwars queues with their own columns in the bedwars table: name -> (key prefix, column prefix)."""
+BEDWARS_SUBMODES = {
+  "solo"   : ("eight_one",  "Solo"),
+  "doubles": ("eight_two",  "Doubles"),
+  "threes" : ("four_three", "Threes"),
+  "fours"  : ("four_four",  "Fours"),
+}
+
+"""Suffixes of the Duels keys kept in the wide duels table."""
+DUELS_COUNTERS = (
+  "_wins", "_losses", "_kills", "_deaths", "_rounds_played", "_goals", "_blocks_placed",
+  "_damage_dealt", "_golden_apples_eaten", "_bow_hits", "_bow_shots", "_melee_hits", "_melee_swings",
+  "_health_regenerated", "_winstreak"
+)
+
+"""Value of winstreak fields for players who hide their winstreak."""
+HIDDEN = -1
+
+"""Columns every stat table has besides the stats themselves."""
+INFO = ["Date", "Display Name"]
+
+
+class Field():
+  def __init__(self, name, path, default=0, stored=True):
+    self.name    = name
+    self.path    = path
+    self.default = default
+    self.stored  = stored
+
+class Sum():
+  def __init__(self, name, container, prefixes, suffix, stored=True):
+    self.name   = name
+    self.keys   = [f"{prefix}_{suffix}" for prefix in prefixes]
+    self.path   = container
+    self.stored = stored
+
+class Total():
+  def __init__(self, name, columns, stored=True):
+    self.name    = name
+    self.columns = columns
+    self.stored  = stored
+
+class Ratio():
+  def __init__(self, name, numerator, denominator, stored=True):
+    self.name        = name
+    self.numerator   = numerator
+    self.denominator = denominator
+    self.stored      = stored
+
+
+MODES = {
+  "bedwars": [
+    Field("Kills",         "player.stats.Bedwars.kills_bedwars"),
+    Field("Deaths",        "player.stats.Bedwars.deaths_bedwars"),
+    Field("Void Deaths",   "player.stats.Bedwars.void_deaths_bedwars"),
+    Field("Final Deaths",  "player.stats.Bedwars.final_deaths_bedwars"),
+    Field("Final Kills",   "player.stats.Bedwars.final_kills_bedwars"),
+    Field("Beds Broken",   "player.stats.Bedwars.beds_broken_bedwars"),
+    Field("Bedwars Level", "player.achievements.bedwars_level"),
+    Field("Games Played",  "player.stats.Bedwars.games_played_bedwars"),
+    Field("Wins",          "player.stats.Bedwars.wins_bedwars"),
+    Field("Losses",        "player.stats.Bedwars.losses_bedwars"),
+    Field("Winstreak",     "player.stats.Bedwars.winstreak", default=HIDDEN),
+    Ratio("K/D Ratio",       "Kills", "Deaths"),
+    Ratio("Final K/D Ratio", "Final Kills", "Final Deaths"),
+  ],
+
+  "bridge": [
+    Sum("Wins",          "player.stats.Duels", BRIDGE_MODES, "wins"),
+    Sum("Losses",        "player.stats.Duels", BRIDGE_MODES, "losses"),
+    Sum("Kills",         "player.stats.Duels", BRIDGE_MODES, "bridge_kills"),
+    Sum("Deaths",        "player.stats.Duels", BRIDGE_MODES, "bridge_deaths"),
+    Total("Games Played", ["Wins", "Losses"]),
+    Sum("Goals",         "player.stats.Duels", BRIDGE_MODES, "goals"),
+    Sum("Blocks Placed", "player.stats.Duels", BRIDGE_MODES, "blocks_placed"),
+    Field("Highest Winstreak", "player.stats.Duels.best_bridge_winstreak", default=HIDDEN),
+    Field("Winstreak",         "player.stats.Duels.current_bridge_winstreak", default=HIDDEN),
+  ],
+
+  "uhc": [
+    Field("Wins",                "player.stats.Duels.uhc_duel_wins"),
+    Field("Losses",              "player.stats.Duels.uhc_duel_losses"),
+    Field("Kills",               "player.stats.Duels.uhc_duel_kills"),
+    Field("Deaths",              "player.stats.Duels.uhc_duel_deaths"),
+    Field("Games Played",        "player.stats.Duels.uhc_duel_rounds_played"),
+    Field("Golden Apples Eaten", "player.stats.Duels.uhc_duel_golden_apples_eaten"),
+    Field("Damage Dealt",        "player.stats.Duels.uhc_duel_damage_dealt"),
+    Field("Blocks Placed",       "player.stats.Duels.uhc_duel_blocks_placed"),
+    Field("Bow Hits",            "player.stats.Duels.uhc_duel_bow_hits"),
+    Field("Bow Shots",           "player.stats.Duels.uhc_duel_bow_shots"),
+    Field("Highest Winstreak",   "player.stats.Duels.best_uhc_winstreak", default=HIDDEN),
+    Field("Winstreak",           "player.stats.Duels.current_uhc_winstreak", default=HIDDEN),
+  ],
+}
+
+def _bedwars_submode(prefix, label):
+  """Fields of one Bedwars queue, named "<label> <stat>", e.g. "Solo Final K/D Ratio"."""
+  stats = {
+    "Kills"       : "kills",
+    "Deaths"      : "deaths",
+    "Void Deaths" : "void_deaths",
+    "Final Kills" : "final_kills",
+    "Final Deaths": "final_deaths",
+    "Beds Broken" : "beds_broken",
+    "Games Played": "games_played",
+    "Wins"        : "wins",
+    "Losses"      : "losses",
+  }
+
+  return [Field(f"{label} {name}", f"player.stats.Bedwars.{prefix}_{key}_bedwars") for name, key in stats.items()] + [
+    Field(f"{label} Winstreak", f"player.stats.Bedwars.{prefix}_winstreak", default=HIDDEN, stored=False),
+    Ratio(f"{label} K/D Ratio",       f"{label} Kills", f"{label} Deaths"),
+    Ratio(f"{label} Final K/D Ratio", f"{label} Final Kills", f"{label} Final Deaths"),
+    Total(f"{label} Finished Games",  [f"{label} Wins", f"{label} Losses"], stored=False),
+    Ratio(f"{label} Win Rate",        f"{label} Wins", f"{label} Finished Games"),
+  ]
+
+for prefix, label in BEDWARS_SUBMODES.values():
+  MODES["bedwars"] += _bedwars_submode(prefix, label)
+
+def submode_column(submode, name) -> str:
+  """Returns the bedwars column holding a stat for a queue, or the overall column if submode is None."""
+  if submode is None:
+    return name
+  return f"{BEDWARS_SUBMODES[submode][1]} {name}"
+
+def _duel(prefix, name):
+  """Fields of a duel mode that only has the common counters."""
+  return [
+    Field("Wins",         f"{DUELS}.{prefix}_wins"),
+    Field("Losses",       f"{DUELS}.{prefix}_losses"),
+    Field("Kills",        f"{DUELS}.{prefix}_kills"),
+    Field("Deaths",       f"{DUELS}.{prefix}_deaths"),
+    Field("Games Played", f"{DUELS}.{prefix}_rounds_played"),
+    Field("Highest Winstreak", f"{DUELS}.best_{name}_winstreak", default=HIDDEN),
+    Field("Winstreak",         f"{DUELS}.current_{name}_winstreak", default=HIDDEN),
+  ]
+
+MODES.update({
+  "sumo"   : _duel("sumo_duel", "sumo"),
+  "classic": _duel("classic_duel", "classic"),
+  "op"     : _duel("op_duel", "op"),
+  "skywars": _duel("sw_duel", "skywars"),
+  "bow"    : _duel("bow_duel", "bow"),
+  "combo"  : _duel("combo_duel", "combo"),
+  "boxing" : _duel("boxing_duel", "boxing"),
+  "blitz"  : _duel("blitz_duel", "blitz"),
+})
+
+
+def _resolve(doc, path):
+  node = doc
+  for key in path:
+    node = node.get(key) if isinstance(node, dict) else None
+  return node if isinstance(node, dict) else {}
+
+def _value(value, default):
+  # Hypixel sometimes has the key with a null value
+  return default if value is None else value
+
+
+class Extractor():
+  """The registry compiled to one lookup per column over the containers the modes read."""
+  def __init__(self, modes: dict):
+    self.modes      = modes
+    self.containers = []
+    self.steps      = {mode: [(field.name, self._compile(field), isinstance(field, (Total, Ratio))) for field in fields] for mode, fields in modes.items()}
+
+  def _container(self, path):
+    path = tuple(path)
+    if path not in self.containers:
+      self.containers.append(path)
+    return self.containers.index(path)
+
+  def _compile(self, field):
+    if isinstance(field, Field):
+      *container, key = field.path.split(".")
+      index, default = self._container(container), field.default
+      return lambda containers, row: _value(containers[index].get(key), default)
+
+    if isinstance(field, Sum):
+      index, keys = self._container(field.path.split(".")), field.keys
+      return lambda containers, row: sum(_value(containers[index].get(key), 0) for key in keys)
+
+    if isinstance(field, Total):
+      columns = field.columns
+      return lambda containers, row: sum(row[column] for column in columns)
+
+    if isinstance(field, Ratio):
+      numerator, denominator = field.numerator, field.denominator
+      return lambda containers, row: row[numerator] / row[denominator] if row[denominator] else 0
+
+    raise TypeError(f"Unknown field type {type(field).__name__}")
+
+  def extract(self, doc: dict, modes=None, derived=True) -> dict:
+    """
+    Returns {mode: {column: value}} for every mode, or only the given modes. With derived=False,
+    totals and ratios are left out so they can be computed for a whole table at once with derive.
+    """
+    containers = [_resolve(doc, path) for path in self.containers]
+    rows = {}
+
+    for mode in (modes or self.modes):
+      row = rows[mode] = {}
+      for name, step, is_derived in self.steps[mode]:
+        if derived or not is_derived:
+          row[name] = step(containers, row)
+    return rows
+
+  def columns(self, mode, stored=True) -> list:
+    """Returns a mode's column names in order, only those kept in the stat tables if stored is set."""
+    return [field.name for field in self.modes[mode] if field.stored or not stored]
+
+
+EXTRACTOR = Extractor(MODES)
+
+def extract(doc: dict, modes=None, derived=True) -> dict:
+  return EXTRACTOR.extract(doc, modes, derived)
+
+def columns(mode, stored=True) -> list:
+  return EXTRACTOR.columns(mode, stored)
+
+
+def _divide(numerator, denominator):
+  return (numerator / denominator.where(denominator != 0)).fillna(0)
+
+def derive(mode, df):
+  """Adds a mode's totals and ratios to a table of its other columns, one vectorized operation per column."""
+  import pandas as pd
+
+  values = {}
+  column = lambda name: values[name] if name in values else df[name]
+
+  for field in MODES[mode]:
+    if isinstance(field, Total):
+      values[field.name] = sum(column(name) for name in field.columns)
+    elif isinstance(field, Ratio):
+      values[field.name] = _divide(column(field.numerator), column(field.denominator))
+
+  # Joined in one go, adding them one at a time fragments the frame
+  return pd.concat([df.drop(columns=[name for name in values if name in df]), pd.DataFrame(values, index=df.index)], axis=1)
+
+def is_state(column) -> bool:
+  """Whether a column is a current value, like a winstreak, rather than a counter that only goes up."""
+  return column in INFO or "Winstreak" in column or column.endswith("_winstreak")
+
+def _reads_duels(field):
+  return isinstance(field, (Total, Ratio)) or field.path.startswith(DUELS + ".") or field.path == DUELS
+
+"""Modes whose columns all come from player.stats.Duels and are computed from the wide duels table."""
+DUEL_MODES = [mode for mode, fields in MODES.items() if all(_reads_duels(field) for field in fields)]
+
+def duels_counters(doc: dict) -> dict:
+  """Returns every counter under player.stats.Duels, the row of the wide duels table."""
+  duels = _resolve(doc, DUELS.split("."))
+  return {key: value for key, value in duels.items()
+          if key.endswith(DUELS_COUNTERS) and isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+def fill_duels(df):
+  """Fills the counters a day had no key for, which happens when a column first appears."""
+  missing = {column: HIDDEN if column.endswith("_winstreak") else 0 for column in df.columns if column not in INFO}
+  df = df.fillna(missing)
+  return df.astype({column: "int64" for column in missing if df[column].dtype.kind == "f" and (df[column] % 1 == 0).all()})
+
+def _field(mode, name):
+  for field in MODES[mode]:
+    if field.name == name:
+      return field
+  raise KeyError(f"{mode} has no column {name}")
+
+def raw_columns(mode, names=None) -> list:
+  """Returns the wide duels table columns needed to compute the given columns of a duel mode, or all of them."""
+  raw = {}
+
+  def visit(name):
+    field = _field(mode, name)
+    if isinstance(field, Field):
+      raw[field.path.split(".")[-1]] = None
+    elif isinstance(field, Sum):
+      raw.update(dict.fromkeys(field.keys))
+    elif isinstance(field, Total):
+      for column in field.columns:
+        visit(column)
+    elif isinstance(field, Ratio):
+      visit(field.numerator)
+      visit(field.denominator)
+
+  for name in (names if names is not None else columns(mode)):
+    if name not in INFO:
+      visit(name)
+  return list(raw)
+
+def aggregate(mode, wide, names=None):
+  """
+  Computes columns of a duel mode from the wide duels table, one vectorized operation per column.
+  Submode sums are row sums over their column group. Counters missing from the table count as 0.
+  """
+  import pandas as pd
+
+  names = [name for name in dict.fromkeys(names if names is not None else columns(mode)) if name not in INFO]
+  info = [column for column in INFO if column in wide]
+  out = wide[info].copy()
+
+  def column(name):
+    if name in out:
+      return out[name]
+
+    field = _field(mode, name)
+    if isinstance(field, Field):
+      key = field.path.split(".")[-1]
+      values = wide[key] if key in wide else pd.Series(field.default, index=wide.index)
+    elif isinstance(field, Sum):
+      values = wide[[key for key in field.keys if key in wide]].sum(axis=1).astype("int64")
+    elif isinstance(field, Total):
+      values = sum(column(name) for name in field.columns)
+    else:
+      values = _divide(column(field.numerator), column(field.denominator))
+
+    out[name] = values
+    return values
+
+  for name in names:
+    column(name)
+  # Dependencies computed along the way are dropped
+  return out[info + names]
@@ -2,42 +2,50 @@ import discord
 from discord.ext import commands, bridge
 from ..config import CONFIG, both_in, guild_in
 
-import logging, requests, datetime
-from .. import util 
-from dateutil import parser
+import logging, datetime
+from .. import util, api, fields
 
 from ..tracking import tracking, databases
 
 from typing import Optional
 
-def parse_from_json(json):
-  """Creates a BedwarsStats object from a JSON response from the Hypixel API."""
+def parse_from_json(json, submode=None):
+  """Creates a BedwarsStats object from a JSON response from the Hypixel API, for one queue if submode is given."""
 
-  winstreak = "N/A"
-  
-  try:
-      winstreak = json["player"]["stats"]["Bedwars"]["winstreak"]
-  except:
-      pass
+  if json is None:
+    return None
+
+  row = fields.extract(json, ["bedwars"])["bedwars"]
+  row["Display Name"] = json["player"]["displayname"]
+  return parse_from_row(row, submode)
+
+def parse_from_row(row, submode=None):
+  """Creates a BedwarsStats object from a row of the bedwars stat or daily table, for one queue if submode is given."""
+
+  if row is None:
+    return None
+
+  col = lambda name: row.get(fields.submode_column(submode, name), fields.HIDDEN)
 
-  kills        = json["player"]["stats"]["Bedwars"]["kills_bedwars"]
-  deaths       = json["player"]["stats"]["Bedwars"]["deaths_bedwars"]
-  voidDeaths   = json["player"]["stats"]["Bedwars"]["void_deaths_bedwars"]
-  finalDeaths  = json["player"]["stats"]["Bedwars"]["final_deaths_bedwars"]
-  finalKills   = json["player"]["stats"]["Bedwars"]["final_kills_bedwars"]
-  bedwarsLevel = json["player"]["achievements"]["bedwars_level"]
-  displayname  = json["player"]["displayname"]
-  gamesplayed  = json["player"]["stats"]["Bedwars"]["games_played_bedwars"]
-  wins         = json["player"]["stats"]["Bedwars"]["wins_bedwars"]
-  losses       = json["player"]["stats"]["Bedwars"]["losses_bedwars"]
-  kdr          = finalKills/finalDeaths
-
-  stats = BedwarsStats(winstreak, kills, deaths, voidDeaths, finalDeaths, finalKills, bedwarsLevel, gamesplayed, wins, losses, kdr, displayname)
+  winstreak    = col("Winstreak") if col("Winstreak") != fields.HIDDEN else "N/A"
+  kills        = col("Kills")
+  deaths       = col("Deaths")
+  voidDeaths   = col("Void Deaths")
+  finalDeaths  = col("Final Deaths")
+  finalKills   = col("Final Kills")
+  bedwarsLevel = row["Bedwars Level"]
+  displayname  = row["Display Name"]
+  gamesplayed  = col("Games Played")
+  wins         = col("Wins")
+  losses       = col("Losses")
+  kdr          = col("Final K/D Ratio")
+
+  stats = BedwarsStats(winstreak, kills, deaths, voidDeaths, finalDeaths, finalKills, bedwarsLevel, gamesplayed, wins, losses, kdr, displayname, submode)
   return stats
 
 
 class BedwarsStats():
-  def __init__(self, winstreak, kills, deaths, voidDeaths, finalDeaths, finalKills, bedwarsLevel, gamesplayed, wins, losses, kdr, displayname):
+  def __init__(self, winstreak, kills, deaths, voidDeaths, finalDeaths, finalKills, bedwarsLevel, gamesplayed, wins, losses, kdr, displayname, submode=None):
     self.winstreak    = winstreak
     self.kills        = kills
     self.deaths       = deaths 
@@ -50,23 +58,19 @@ class BedwarsStats():
     self.losses       = losses
     self.kdr          = kdr
     self.displayname  = displayname
+    self.submode      = submode
 
     self.lastResponse = None
   
   @staticmethod
-  def get(key: str, uuid=None, username=None):
+  async def get(uuid=None, username=None, submode=None):
     if uuid is None and username is not None:
-      uuid = util.getUUID(username)
+      uuid = await util.getUUID(username)
     
-    response = None
-    url = f'https://api.hypixel.net/player?key={key}&uuid={uuid}'
     try:
-      logging.debug(f"Making web request to {url}")
-      response = requests.get(url)
-
-      return parse_from_json(response.json())
+      return parse_from_json(await api.fetch_player(uuid), submode)
     except Exception as e:
-      logging.error(f"Error while making request to {url}. Response code: {response.status_code}.")
+      logging.error(f"Error while getting Bedwars stats for {uuid}: {e}")
       raise e
 
   def __add__(self, other):
@@ -81,7 +85,7 @@ class BedwarsStats():
     lossesfinal       = self.losses + other.losses
     kdrfinal          = self.kdr + other.kdr
 
-    return BedwarsStats(self.winstreak, killsfinal, deathsfinal, voidDeathsfinal, finalDeathsfinal, finalKillsfinal, bedwarsLevelfinal, gamesplayedfinal, winsfinal, lossesfinal, kdrfinal, self.displayname)
+    return BedwarsStats(self.winstreak, killsfinal, deathsfinal, voidDeathsfinal, finalDeathsfinal, finalKillsfinal, bedwarsLevelfinal, gamesplayedfinal, winsfinal, lossesfinal, kdrfinal, self.displayname, self.submode)
 
   def __sub__(self, other):
     killsfinal        = self.kills - other.kills
@@ -100,7 +104,7 @@ class BedwarsStats():
     except:
         pass
 
-    return BedwarsStats(self.winstreak, killsfinal, deathsfinal, voidDeathsfinal, finalDeathsfinal, finalKillsfinal, bedwarsLevelfinal, gamesplayedfinal, winsfinal, lossesfinal, kdrfinal, self.displayname)
+    return BedwarsStats(self.winstreak, killsfinal, deathsfinal, voidDeathsfinal, finalDeathsfinal, finalKillsfinal, bedwarsLevelfinal, gamesplayedfinal, winsfinal, lossesfinal, kdrfinal, self.displayname, self.submode)
 
   def to_embed_dict(self):
     winloss = 0
@@ -123,10 +127,15 @@ class BedwarsStats():
     }
 
     return embed_dict
+
+  def mode_name(self):
+    if self.submode is None:
+      return "Bedwars"
+    return f"{fields.BEDWARS_SUBMODES[self.submode][1]} Bedwars"
   
   def to_embed(self, embed=None):
     if embed is None:
-      embed = discord.Embed(title = self.displayname, description = "Bedwars stats for " + self.displayname, color=0x00ff00 )
+      embed = discord.Embed(title = self.displayname, description = f"{self.mode_name()} stats for " + self.displayname, color=0x00ff00 )
 
     d = self.to_embed_dict()
     for key in d.keys():
@@ -136,7 +145,18 @@ class BedwarsStats():
   
   def to_date_embed(self, date: datetime.datetime, embed: discord.Embed = None):
     if embed is None:
-      embed = discord.Embed(title = self.displayname, description = f"Bedwars progress for {self.displayname} on {date.strftime('%m/%d/%y')}")
+      embed = discord.Embed(title = self.displayname, description = f"{self.mode_name()} progress for {self.displayname} on {date.strftime('%m/%d/%y')}")
+
+    d = self.to_embed_dict()
+    for key in d.keys():
+      value = d[key]
+      embed.add_field(name = key, value = value, inline = False)
+
+    return embed
+
+  def to_range_embed(self, start: datetime.datetime, end: datetime.datetime, embed: discord.Embed = None):
+    if embed is None:
+      embed = discord.Embed(title = self.displayname, description = f"{self.mode_name()} progress for {self.displayname} between {start.strftime('%m/%d/%y')} and {end.strftime('%m/%d/%y')}")
 
     d = self.to_embed_dict()
     for key in d.keys():
@@ -153,42 +173,64 @@ class Bedwars(commands.Cog):
 
   @bridge.bridge_command(name="bw", aliases=["bedwars", "bwstats", "statsBW"], integration_types = both_in if CONFIG.ALLOW_USER_INSTALLS else guild_in)
   @util.self_argument
-  async def bw(self, ctx, username: bridge.BridgeOption(str, description="The username of the player you want to see stats for.") = None, date: bridge.BridgeOption(str, description="Get stats for a specific date. Requires tracking.") = None):
+  async def bw(self, ctx, username: bridge.BridgeOption(str, description="The username of the player you want to see stats for.") = None, date: bridge.BridgeOption(str, description="Get stats for a specific date, or a window like 7d or 1m. Requires tracking.") = None,
+               submode: bridge.BridgeOption(str, choices=list(fields.BEDWARS_SUBMODES), description="Only show stats for one queue.") = None):
     if username is None:
       await ctx.respond("Please provide a username or UUID.")
       return
-    uuid = util.getUUID(username)
+    uuid = await util.getUUID(username)
     
     if date is not None:
       if not CONFIG.TRACKING_ENABLED:
         await ctx.respond("Tracking is not enabled.")
         return
 
+      window = util.parse_window(date)
+      if window is not None:
+        # Progress over a relative window is the difference of two rows found by binary search
+        end = datetime.datetime.now()
+        row = databases.get_range(uuid, "bedwars", end - window, end)
+        stats = parse_from_row(row, submode)
+        if stats is None:
+          await ctx.respond(util.no_data_message(uuid, f"No tracking data for {username} in the last {date.strip()}."))
+          return
+
+        # The snapshots compared, which start later than the window if tracking started later
+        await ctx.respond(embed=stats.to_range_embed(*databases.range_dates(row)))
+        return
+
+      from dateutil import parser
       date = parser.parse(date)
 
-      stats_day = parse_from_json(databases.getJSON(date, uuid=uuid))
-      stats_yesterday = parse_from_json(databases.getJSON(date - datetime.timedelta(days=1), uuid=uuid))
-      stats = stats_day - stats_yesterday
+      # The day's gains are precomputed when the tables are rebuilt
+      stats = parse_from_row(databases.get_day(uuid, "bedwars", date), submode)
+      if stats is None:
+        await ctx.respond(util.no_data_message(uuid, f"No tracking data for {username} on {date.strftime('%m/%d/%y')}."))
+        return
 
       await ctx.respond(embed=stats.to_date_embed(date))
       return
 
+    # Only live stats need the API key, tracked ones keep working without it
+    if CONFIG.KEY_VALID is False:
+      return await util.fail_key_required(self, ctx)
 
     try:
-      await ctx.respond(embed = BedwarsStats.get(CONFIG.KEY, uuid=uuid).to_embed())
+      await ctx.respond(embed = (await BedwarsStats.get(uuid=uuid, submode=submode)).to_embed())
     except Exception as e:
       await ctx.respond(f"Error while getting stats. Are you sure `{username}` is correct?")
 
   # TRACKING COMMANDS
   @bridge.bridge_command(name="today_bw", aliases=["todayBW"], integration_types = both_in if CONFIG.ALLOW_USER_INSTALLS else guild_in)
   @util.tracking_required
+  @util.key_required
   @util.self_argument
   async def today_bw(self, ctx, username: bridge.BridgeOption(str, description="The username of the player who's stats you want to see.") = None):
     #checks
     if username is None:
       await ctx.respond("Please provide a valid username.")
 
-    uuid = util.getUUID(username)
+    uuid = await util.getUUID(username)
 
     if uuid is None:
       return
@@ -203,11 +245,13 @@ class Bedwars(commands.Cog):
 
     d_yesterday = datetime.datetime.now()
 
-    today = BedwarsStats.get(key=CONFIG.KEY, uuid=uuid)
-    yesterday = parse_from_json(databases.getJSON(d_yesterday, uuid=uuid))
+    today = await BedwarsStats.get(uuid=uuid)
+    # Today's snapshot only, an earlier one would count more than today
+    yesterday = parse_from_row(databases.get_row_on(uuid, "bedwars", d_yesterday))
 
     if yesterday is None:
-      await ctx.respond(f"No tracking data for {username} yesterday.")
+      await ctx.respond(util.no_data_message(uuid, f"No tracking data for {username} yesterday."))
+      return
 
     data = today-yesterday
 
@@ -224,7 +268,7 @@ class Bedwars(commands.Cog):
     if username is None:
       await ctx.respond("please provide a username or UsUID")
 
-    uuid = util.getUUID(username)
+    uuid = await util.getUUID(username)
 
     if uuid is None:
       return
@@ -237,15 +281,12 @@ class Bedwars(commands.Cog):
     wkdir = CONFIG.PATH + "/dat/trackedplayers/" + uuid + "/"
 
     d_yesterday = datetime.datetime.now()
-    d_daybefore = datetime.datetime.now() - datetime.timedelta(days=1)
 
-    yesterday = parse_from_json(databases.getJSON(d_yesterday, uuid=uuid))
-    daybefore = parse_from_json(databases.getJSON(d_daybefore, uuid=uuid))
+    data = parse_from_row(databases.get_day(uuid, "bedwars", d_yesterday))
 
-    if yesterday is None or daybefore is None:
+    if data is None:
       await ctx.respond(f"Unable to get data. Ensure the player has been tracked for at least 2 days.")
-
-    data = yesterday-daybefore
+      return
 
     date_formatted = d_yesterday.strftime("%m/%d/%y")
 
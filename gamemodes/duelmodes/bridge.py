@@ -1,11 +1,12 @@
-import discord, requests, datetime
+import discord, datetime
 from ...util import get_prestige_halved, wins_to_prestige_halved
-from ...tracking.databases import getJSON
+from ...tracking.databases import get_day, get_row, get_range, range_dates
 from dataclasses import dataclass
 from typing import Union
 import logging
 
-from ...config import CONFIG
+from ...api import fetch_player
+from ... import fields
 
 @dataclass
 class BridgeStats():
@@ -26,84 +27,47 @@ class BridgeStats():
   @classmethod
   def from_json(cls, json: dict):
     try:
-      player_stats = json["player"]["stats"]["Duels"]
-      username = json["player"]["displayname"]
-
-      wins = (
-        player_stats.get("bridge_duel_wins", 0) +
-        player_stats.get("bridge_doubles_wins", 0) +
-        player_stats.get("bridge_threes_wins", 0) +
-        player_stats.get("bridge_four_wins", 0) +
-        player_stats.get("bridge_3v3v3v3_wins", 0)
-      )
-
-      losses = (
-        player_stats.get("bridge_duel_losses", 0) +
-        player_stats.get("bridge_doubles_losses", 0) +
-        player_stats.get("bridge_threes_losses", 0) +
-        player_stats.get("bridge_four_losses", 0) +
-        player_stats.get("bridge_3v3v3v3_losses")
-      )
-
-      kills = (
-        player_stats.get("bridge_duel_bridge_kills", 0) +
-        player_stats.get("bridge_doubles_bridge_kills", 0) +
-        player_stats.get("bridge_threes_bridge_kills", 0) +
-        player_stats.get("bridge_four_bridge_kills", 0) +
-        player_stats.get("bridge_3v3v3v3", 0)
-      )
-
-      deaths = (
-        player_stats.get("bridge_duel_bridge_deaths", 0) +
-        player_stats.get("bridge_doubles_bridge_deaths", 0) +
-        player_stats.get("bridge_threes_bridge_deahts", 0) +
-        player_stats.get("bridge_four_bridge_deaths", 0) +
-        player_stats.get("bridge_3v3v3v3_bridge_deaths", 0)
-      )
-
-      goals = (
-        player_stats.get("bridge_duel_goals", 0) +
-        player_stats.get("bridge_doubles_goals", 0) +
-        player_stats.get("bridge_threes_goals", 0) +
-        player_stats.get("bridge_four_goals", 0) +
-        player_stats.get("bridge_3v3v3v3_goals", 0)
-      )
-
-      blocks_placed = (
-        player_stats.get("bridge_duel_blocks_placed", 0) +
-        player_stats.get("bridge_doubles_blocks_placed", 0) +
-        player_stats.get("bridge_threes_blocks_placed", 0) +
-        player_stats.get("bridge_four_blocks_placed", 0) +
-        player_stats.get("bridge_3v3v3v3_blocks_placed", 0)
-      )
-
-      games_played = wins + losses
-
-      highest_winstreak = player_stats.get("best_bridge_winstreak", "This player has their winstreak hidden")
-      winstreak = player_stats.get("current_bridge_winstreak", "This player has their winstreak hidden")
-
-      prestige = get_prestige_halved(wins)
-      next_prestige, wins_needed = wins_to_prestige_halved(wins)
-
-      return cls(
-        username=username,
-        wins=wins,
-        losses=losses,
-        kills=kills,
-        deaths=deaths,
-        games_played=games_played,
-        goals=goals,
-        blocks_placed=blocks_placed,
-        highest_winstreak=highest_winstreak,
-        winstreak=winstreak,
-        prestige=prestige,
-        next_prestige=next_prestige,
-        wins_to_prestige=wins_needed
-      )
+      row = fields.extract(json, ["bridge"])["bridge"]
+      row["Display Name"] = json["player"]["displayname"]
+      return cls.from_row(row)
 
     except KeyError:
       return None
 
+  @classmethod
+  def from_row(cls, row: dict, prestige_wins=None):
+    """
+    Creates a BridgeStats from a row of bridge stats or daily gains. prestige_wins is the player's
+    total wins, for rows of daily gains whose own wins don't give the prestige.
+    """
+    if row is None:
+      return None
+
+    wins = row["Wins"]
+    prestige_wins = wins if prestige_wins is None else prestige_wins
+
+    highest_winstreak = row["Highest Winstreak"] if row["Highest Winstreak"] != fields.HIDDEN else "This player has their winstreak hidden"
+    winstreak         = row["Winstreak"] if row["Winstreak"] != fields.HIDDEN else "This player has their winstreak hidden"
+
+    prestige = get_prestige_halved(prestige_wins)
+    next_prestige, wins_needed = wins_to_prestige_halved(prestige_wins)
+
+    return cls(
+      username=row["Display Name"],
+      wins=wins,
+      losses=row["Losses"],
+      kills=row["Kills"],
+      deaths=row["Deaths"],
+      games_played=row["Games Played"],
+      goals=row["Goals"],
+      blocks_placed=row["Blocks Placed"],
+      highest_winstreak=highest_winstreak,
+      winstreak=winstreak,
+      prestige=prestige,
+      next_prestige=next_prestige,
+      wins_to_prestige=wins_needed
+    )
+
   def __add__(self, other):
       wins = self.wins + other.wins
       losses = self.losses + other.losses
@@ -213,7 +177,7 @@ class BridgeStats():
     embed = discord.Embed(title=f"{self.username}'s bridge progress between {start_date_formatted} and {end_date_formatted}", color=color)
 
     fields = {
-    "Games Played": self.gamesPlayed,
+    "Games Played": self.games_played,
     "Win Rate": f"{round((self.wins*100)/(self.wins+self.losses))}%" if self.wins + self.losses != 0 else "N/A",
     "Wins": self.wins,
     "Losses": self.losses,
@@ -228,36 +192,33 @@ class BridgeStats():
   
     return embed
 
-def today_stats(uuid):
-  json = requests.get(f"https://api.hypixel.net/player?key={CONFIG.KEY}&uuid={uuid}").json()
+async def today_stats(uuid):
+  json = await fetch_player(uuid)
   return BridgeStats.from_json(json).toEmbed()
 
-def get_bridge_stats_embed(uuid, start_date, end_date):
+async def get_bridge_stats_embed(uuid, start_date, end_date):
   if start_date is None:
-    return today_stats(uuid)
+    return await today_stats(uuid)
   elif end_date is None:
     #specific date
     if end_date == datetime.date.today():
-      return today_stats(uuid)
+      return await today_stats(uuid)
 
-    date = BridgeStats.from_json(getJSON(start_date, uuid=uuid))
-    yesterday = BridgeStats.from_json(getJSON(start_date - datetime.timedelta(days=1), uuid=uuid))
-    if date is None or yesterday is None:
+    # Both rows come from the stat tables, the day's gains are precomputed
+    day = get_day(uuid, "bridge", start_date)
+    total = get_row(uuid, "bridge", start_date)
+    if day is None or total is None:
       return None
-    stats = date - yesterday
+    stats = BridgeStats.from_row(day, prestige_wins=total["Wins"])
 
     return stats.toDateEmbed(start_date)
   else:
     #date_range
-    start_json = getJSON(start_date, uuid=uuid)
-    end_json = getJSON(end_date, uuid=uuid)
-
-    if start_json is None or end_json is None:
+    # The rows either side of the range are found by binary search and subtracted
+    row = get_range(uuid, "bridge", start_date, end_date)
+    stats = BridgeStats.from_row(row)
+    if stats is None:
       return None
 
-    start_stats = BridgeStats.from_json(start_json)
-    end_stats = BridgeStats.from_json(end_json)
-
-    stats: BridgeStats = end_stats - start_stats
-
-    return stats.toDateRangeEmbed(start_date, end_date)
+    # The dates of the snapshots compared, not the ones asked for
+    return stats.toDateRangeEmbed(*range_dates(row))
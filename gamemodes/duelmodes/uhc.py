@@ -1,12 +1,13 @@
-import discord, requests, datetime
+import discord, datetime
 
 from ...util import get_prestige, wins_to_prestige
 
 from dataclasses import dataclass
 
-from ...tracking.databases import getJSON
+from ...tracking.databases import get_day, get_row, get_range, range_dates
 
-from ...config import CONFIG
+from ...api import fetch_player
+from ... import fields
 from typing import Optional 
 
 @dataclass
@@ -33,31 +34,43 @@ class UHCStats():
       return None
 
     try:
-      stats    = json_data["player"]["stats"]["Duels"]
-      username = json_data["player"]["displayname"]
-      wins     = stats.get("uhc_duel_wins", 0)
-
-      return cls(
-        username          = username,
-        wins              = wins,
-        prestige          = get_prestige(wins),
-        next_prestige     = wins_to_prestige(wins),
-        losses            = stats.get("uhc_duel_losses", 0),
-        kills             = stats.get("uhc_duel_kills", 0),
-        deaths            = stats.get("uhc_duel_deaths", 0),
-        gamesPlayed       = stats.get("uhc_duel_rounds_played", 0),
-        goldenApplesEaten = stats.get("uhc_duel_golden_apples_eaten", 0),
-        damageDealt       = stats.get("uhc_duel_damage_dealt", 0),
-        blocksPlaced      = stats.get("uhc_duel_blocks_placed", 0),
-        highest_winstreak = stats.get("best_uhc_winstreak", "This player has their winstreak hidden."),
-        winstreak         = stats.get("current_uhc_winstreak", "Thjis player has their winstreak hidden."),
-        bow_hits          = stats.get("uhc_duel_bow_hits", 0),
-        bow_shots         = stats.get("uhc_duel_bow_shots", 0)
-      )
+      row = fields.extract(json_data, ["uhc"])["uhc"]
+      row["Display Name"] = json_data["player"]["displayname"]
+      return cls.from_row(row)
 
     except KeyError:
       return None
 
+  @classmethod
+  def from_row(cls, row: dict, prestige_wins=None):
+    """
+    Creates a UHCStats from a row of UHC stats or daily gains. prestige_wins is the player's total
+    wins, for rows of daily gains whose own wins don't give the prestige.
+    """
+    if row is None:
+      return None
+
+    wins          = row["Wins"]
+    prestige_wins = wins if prestige_wins is None else prestige_wins
+
+    return cls(
+      username            = row["Display Name"],
+      wins                = wins,
+      prestige            = get_prestige(prestige_wins),
+      next_prestige       = wins_to_prestige(prestige_wins),
+      losses              = row["Losses"],
+      kills               = row["Kills"],
+      deaths              = row["Deaths"],
+      games_played        = row["Games Played"],
+      golden_apples_eaten = row["Golden Apples Eaten"],
+      damage_dealt        = row["Damage Dealt"],
+      blocks_placed       = row["Blocks Placed"],
+      highest_winstreak   = row["Highest Winstreak"] if row["Highest Winstreak"] != fields.HIDDEN else "This player has their winstreak hidden.",
+      winstreak           = row["Winstreak"] if row["Winstreak"] != fields.HIDDEN else "This player has their winstreak hidden.",
+      bow_hits            = row["Bow Hits"],
+      bow_shots           = row["Bow Shots"]
+    )
+
   def __sub__(self, other):
     wins                = self.wins - other.wins
     losses              = self.losses - other.losses
@@ -165,33 +178,35 @@ class UHCStats():
 
     return embed   
     
-def today_stats(uuid):
-  json = requests.get(f"https://api.hypixel.net/player?key={CONFIG.KEY}&uuid={uuid}").json()
+async def today_stats(uuid):
+  json = await fetch_player(uuid)
   return UHCStats.from_json(json).to_embed()
 
-def get_UHC_stats_embed(uuid: str, start_date: datetime.datetime | None, end_date: datetime.datetime | None):
+async def get_UHC_stats_embed(uuid: str, start_date: datetime.datetime | None, end_date: datetime.datetime | None):
   if start_date is None:
-    today_stats(uuid)
+    return await today_stats(uuid)
   
   #specific date
   elif end_date is None:
     if start_date == datetime.date.today():
-      return today_stats(uuid)
+      return await today_stats(uuid)
     
-    date = UHCStats.from_json(getJSON(start_date, uuid=uuid))
-    yesterday = UHCStats.from_json(getJSON(start_date - datetime.timedelta(days=1), uuid=uuid))
-    stats = date - yesterday
+    # Both rows come from the stat tables, the day's gains are precomputed
+    day = get_day(uuid, "uhc", start_date)
+    total = get_row(uuid, "uhc", start_date)
+    if day is None or total is None:
+      return None
+    stats = UHCStats.from_row(day, prestige_wins=total["Wins"])
   
     return stats.to_date_embed(start_date)
   
   #date range
   else:
-    start_json = getJSON(start_date, uuid=uuid)
-    end_json = getJSON(end_date, uuid=uuid)
-
-    start_stats = UHCStats.from_json(start_json)
-    end_stats = UHCStats.from_json(end_json)
-
-    stats: UHCStats = end_stats - start_stats
+    # The rows either side of the range are found by binary search and subtracted
+    row = get_range(uuid, "uhc", start_date, end_date)
+    stats = UHCStats.from_row(row)
+    if stats is None:
+      return None
 
-    return stats.to_date_range_embed(start_date, end_date)
\ No newline at end of file
+    # The dates of the snapshots compared, not the ones asked for
+    return stats.to_date_range_embed(*range_dates(row))
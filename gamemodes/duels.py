@@ -5,7 +5,6 @@ import logging
 from ..config import CONFIG, both_in, guild_in
 from typing import Optional
 
-from dateutil import parser
 from datetime import datetime
 
 
@@ -22,7 +21,7 @@ class Duels(commands.Cog):
     pass
 
   async def _duels_stats(self, ctx, duelmode, start, end, username):
-    uuid = util.getUUID(username)
+    uuid = await util.getUUID(username)
 
     if uuid is None:
       await ctx.respond(f"Please ensure {username} is a proper username.")
@@ -33,11 +32,18 @@ class Duels(commands.Cog):
       return
 
     if CONFIG.TRACKING_ENABLED:
-      if start is not None:
+      from dateutil import parser
+
+      window = util.parse_window(start)
+      if window is not None:
+        # A relative window like 7d covers the days up to now
+        end = datetime.today()
+        start = end - window
+      elif start is not None:
         today_synonyms = ["today", "t"]
         start = datetime.today() if start in today_synonyms else parser.parse(start)
       
-      if end is not None:
+      if end is not None and not isinstance(end, datetime):
         end = parser.parse(end)
     else:
       if start is not None or end is not None:
@@ -46,15 +52,19 @@ class Duels(commands.Cog):
       start = None
       end = None
 
+    # Only live stats need the API key, tracked ones keep working without it
+    if start is None and CONFIG.KEY_VALID is False:
+      return await util.fail_key_required(self, ctx)
+
     duelmode = duelmode.lower()
     if duelmode not in duelmodes:
       await ctx.respond(f"No duelmode {duelmode}. Please ensure you enter a proper duelmode.")
 
     embed = None
     try:
-      embed = duelmodes[duelmode](uuid, start, end)
+      embed = await duelmodes[duelmode](uuid, start, end)
       if embed is None:
-        await ctx.respond(f"Data out of range. Please ensure you request a date range for which data exists.")
+        await ctx.respond(util.no_data_message(uuid, f"Data out of range. Please ensure you request a date range for which data exists."))
         return
     except Exception as e:
       logging.error(e)
@@ -74,7 +84,7 @@ class Duels(commands.Cog):
   @bridge.bridge_command(name="duels", integration_types = both_in if CONFIG.ALLOW_USER_INSTALLS else guild_in)
   @util.self_argument
   async def duels(self, ctx, duelmode: bridge.BridgeOption(str, choices=["bridge", "uhc"]), 
-                  start: bridge.BridgeOption(str, description="The start date for a range. If you just want stats for today you can also just put t.")=None, 
+                  start: bridge.BridgeOption(str, description="Start date, or a window like 7d, 2w or 1m. Use t for today.")=None, 
                   end: bridge.BridgeOption(str, description="The end date for a range. Can be left blank.")=None, 
                   username: bridge.BridgeOption(str, description="The username of the person you want to see stats for.")=None):
     await self._duels_stats(ctx, duelmode, start, end, username)
\ No newline at end of file
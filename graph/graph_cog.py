@@ -2,8 +2,7 @@ import discord
 from discord.ext import commands
 
 from ..config import CONFIG, both_in, guild_in
-from .. import util
-from . import graphing
+from .. import util, fields
 
 
 
@@ -11,6 +10,19 @@ class Graph(commands.Cog):
   def __init__(self):
     pass
 
+  @commands.Cog.listener()
+  async def on_ready(self):
+    if not CONFIG.TRACKING_ENABLED:
+      return
+
+    # Starts the render workers so the first graphs don't wait for matplotlib to load
+    from . import render
+    render.warm()
+
+  def cog_unload(self):
+    from . import render
+    render.shutdown_pool()
+
 
   @commands.slash_command(name = "graph-bw", integration_types = both_in if CONFIG.ALLOW_USER_INSTALLS else guild_in)
   @util.self_argument
@@ -20,11 +32,12 @@ class Graph(commands.Cog):
                              x_axis: discord.Option(str, default="Games", description="The desired x-axis variable. Defaults to games if left blank"),
                              username: discord.Option(str, required=False, description="The username of the player you're trying to see stats for."),
                              days: discord.Option(type=int, default=0, description="The number of days you want to see data for. Default shows all historical data."),
-                             n: discord.Option(type=int, default=0, description="The number of recodrs you want to show. Default to all.")):
+                             n: discord.Option(type=int, default=0, description="The number of recodrs you want to show. Default to all."),
+                             submode: discord.Option(str, choices=list(fields.BEDWARS_SUBMODES), required=False, description="Only graph one queue.")):
     await ctx.defer()
     days = int(days)
     n = int(n)
-    username = util.getUUID(username)
+    username = await util.getUUID(username)
 
     if username is None:
       await ctx.respond("You must provide a valid username.")
@@ -34,13 +47,15 @@ class Graph(commands.Cog):
       await ctx.respond("You must provide only days or n, not both.")
       return
     
-    await graphing.graph_bw(ctx, username, x_axis, y_axis, days, n)
+    # Imported here so matplotlib and pandas are only loaded once someone graphs
+    from . import graphing
+    await graphing.graph_bw(ctx, username, x_axis, y_axis, days, n, submode)
   
   @commands.slash_command(name = "graph-duels", integration_types = both_in if CONFIG.ALLOW_USER_INSTALLS else guild_in)
   @util.self_argument
   @util.tracking_required
   async def graph_duels(self, ctx,
-                        duelmode: discord.Option(str, description="The duels gamemode you want to graph."),
+                        duelmode: discord.Option(str, choices=fields.DUEL_MODES, description="The duels gamemode you want to graph."),
                         y_axis: discord.Option(str, description="The desired y-axis variable."),
                         x_axis: discord.Option(str, default="Games", description="The desired x-axis variable. Defaults to games if left blank."),
                         username: discord.Option(str, required=False, description="The username of the player you're trying to see stats for"),
@@ -50,18 +65,14 @@ class Graph(commands.Cog):
     days = int(days)
     n = int(n)
 
-    # TODO add UHC
-    gamemodes = {
-      'bridge': graphing.graph_bridge,
-    }
+    from . import graphing
 
-    # TODO add nicer user interface
-    if not duelmode.lower() in gamemodes:
+    duelmode = duelmode.lower()
+    if duelmode not in fields.DUEL_MODES:
       await ctx.respond("You must provide a valid gamemode.")
       return
-    func = gamemodes[duelmode.lower()]
 
-    uuid = util.getUUID(username)
+    uuid = await util.getUUID(username)
     if uuid is None:
       await ctx.respond("You must provide a valid username.")
       return
@@ -70,4 +81,4 @@ class Graph(commands.Cog):
       await ctx.respond("You must provide only days or n, not both.")
       return
 
-    await func(ctx, duelmode, uuid, x_axis, y_axis, days, n)
\ No newline at end of file
+    await graphing.graph_duel(ctx, duelmode, uuid, x_axis, y_axis, days, n)
\ No newline at end of file
@@ -2,32 +2,38 @@ import discord
 from discord.ext.commands import Context
 
 from ..tracking import databases
+from ..cache import SizedLRUCache
+from ..config import CONFIG
+from .. import fields, util
 
 import pandas as pd
-import matplotlib.pyplot as plt
 
-import datetime
+import datetime, io
 
-import os
+from . import render
 
-# Turn interactive mode off so we don't show plots
-plt.ioff()
+"""PNGs of rendered graphs, keyed by what was graphed and checked against the player's data version. Created on first use."""
+_graphs = None
 
-def process_df(df: pd.DataFrame, days: int=0, n: int=0, since_start: bool=True) -> pd.DataFrame:
-    df["Date"] = pd.to_datetime(df["Date"], format="%d-%m-%y", dayfirst=True)
-    df = df.sort_values("Date")
+def graph_cache() -> SizedLRUCache:
+  global _graphs
 
-    check_cols = df.select_dtypes(include=['number']).columns.tolist()
-    is_duplicate = (df[check_cols] == df[check_cols].shift()).all(axis=1)
-    
-    # Keep rows that are NOT duplicates
-    df = df[~is_duplicate]
+  if _graphs is None:
+    _graphs = SizedLRUCache(int(CONFIG.GRAPH_CACHE_MB * 1024 * 1024))
+  return _graphs
 
+def process_df(df: pd.DataFrame, days: int=0, n: int=0, since_start: bool=True) -> pd.DataFrame:
+    """
+    Returns the last n rows or last days days of a frame from databases.get_frame. The frame is
+    shared with other commands and is never modified: it is already sorted, indexed by date and
+    free of unchanged rows, so the window is a slice found by binary search, and only rebasing the
+    counters to the start of the window makes a copy.
+    """
     if n > 0:
-        df = df.tail(n)
-    if days > 0:
-        latest = df['Date'].max()
-        df = df[df['Date'] >= (latest - datetime.timedelta(days=days))]
+        df = df.iloc[-n:]
+    if days > 0 and not df.empty:
+        start = df.index.searchsorted(df.index[-1] - datetime.timedelta(days=days))
+        df = df.iloc[start:]
 
     if df.empty:
         return df
@@ -44,7 +50,7 @@ def process_df(df: pd.DataFrame, days: int=0, n: int=0, since_start: bool=True)
         cols_to_zero = df.select_dtypes(include=['number']).columns
         cols_to_zero = [c for c in cols_to_zero if c not in ignore_cols and "Ratio" not in c and "Rate" not in c]
 
-        df[cols_to_zero] = df[cols_to_zero].subtract(df[cols_to_zero].iloc[0])
+        df = df.assign(**df[cols_to_zero].subtract(df[cols_to_zero].iloc[0]))
 
     return df
 # TODO as a n parameter so you can see only recent data
@@ -73,9 +79,44 @@ def match_bedwars_variable(var: str) -> str:
     if var in bw_variables[key]:
       return key
 
+def win_rate_columns(column) -> tuple:
+  """Returns the wins and losses columns a win rate column is computed from, or None for other columns."""
+  if column == "Win Rate":
+    return "Wins", "Losses"
+  if column.endswith(" Win Rate"):
+    queue = column[:-len("Win Rate")]
+    return f"{queue}Wins", f"{queue}Losses"
+  return None
+
+def axis_columns(label) -> list:
+  """Returns the stored columns needed to plot a label."""
+  counters = win_rate_columns(label)
+  if counters is not None:
+    return list(counters)
+  return [label]
+
+def graph_columns(x_label, y_label) -> list:
+  # Games Played changes whenever anything else does, so it is always read for process_df's dedupe
+  return ["Date", "Games Played"] + axis_columns(x_label) + axis_columns(y_label)
+
+def graph_frame(uuid, mode, columns, days, n):
+  """Reads the rows a graph needs. The last n records are always daily, windows of days switch to weekly or monthly rows when they are long."""
+  if n > 0:
+    return databases.get_frame(uuid, mode, columns)
+  return databases.get_window(uuid, mode, columns, days)
+
+def bw_column(label, submode=None) -> str:
+  """Returns the column a label is read from, the precomputed queue column if a submode is given."""
+  if submode is None or label in ("Date", "Bedwars Level"):
+    return label
+  return fields.submode_column(submode, label)
+
 def get_bw_axis(df, label):
-  if label == "Win Rate":
-    return df["Wins"] / (df["Wins"] + df["Losses"])
+  # Computed from the rebased counters, as the stored queue win rates are lifetime values
+  counters = win_rate_columns(label)
+  if counters is not None:
+    wins, losses = counters
+    return df[wins] / (df[wins] + df[losses])
   else:
     return df[label]
 
@@ -87,96 +128,100 @@ def bad_bw_labels_embed() -> discord.Embed:
 
   return embed
 
-async def graph_bw(ctx: Context, uuid: str, x_label: str, y_label: str, days: int, n: int):
-  df: pd.DataFrame = databases.databases[uuid]["bedwars"]
-  df = process_df(df, days, n)  
-  
+async def graph_bw(ctx: Context, uuid: str, x_label: str, y_label: str, days: int, n: int, submode: str = None):
   y_label = match_bedwars_variable(y_label)
   x_label = match_bedwars_variable(x_label)
 
   if x_label is None or y_label is None:
     await ctx.respond(embed=bad_bw_labels_embed())
     return
-  
-  x_axis = get_bw_axis(df, x_label)
-  y_axis = get_bw_axis(df, y_label)
-
-  fig, ax = plt.subplots()
-  ax.plot(x_axis, y_axis)
 
-  fig.autofmt_xdate()
+  # Queue stats are read from the queue's own columns
+  x_column = bw_column(x_label, submode)
+  y_column = bw_column(y_label, submode)
+
+  # A repeated graph is sent again until a rebuild adds rows for the player
+  key = ("bedwars", uuid, submode, x_column, y_column, days, n)
+  version = databases.data_version(uuid, "bedwars")
+  png = graph_cache().get(key, version)
+
+  if png is None:
+    df: pd.DataFrame = graph_frame(uuid, "bedwars", graph_columns(x_column, y_column), days, n)
+    if df is None or df.empty:
+      await ctx.respond(util.no_data_message(uuid, "There is no tracking data for this player yet."))
+      return
+    df = process_df(df, days, n)
+    
+    x_axis = get_bw_axis(df, x_column)
+    y_axis = get_bw_axis(df, y_column)
 
-  ax.set_title(f"Bedwars Stats")
-  ax.set_ylabel(f"{y_label}")
-  ax.set_xlabel(f"{x_label}")
+    # Rendered in the graph pool and sent from memory
+    png = await render.render(x_axis.to_numpy(), y_axis.to_numpy(), f"{fields.BEDWARS_SUBMODES[submode][1] + ' ' if submode else ''}Bedwars Stats", x_label, y_label)
+    graph_cache().set(key, png, len(png), version)
 
-  fig.savefig("tmp.jpeg")
-  await ctx.respond(file=discord.File("tmp.jpeg"))
-  os.remove("tmp.jpeg")
-  
-  plt.close(fig)
+  await ctx.respond(file=discord.File(io.BytesIO(png), filename="graph.png"))
 
 
 
 
-bridge_variables = {
+# Aliases for duel mode columns. Columns not listed here are matched by their lowercase name
+duel_aliases = {
   "Date": ["date", "time"],
-  "Kills": ["kills"],
-  "Deaths": ["deaths"], 
   "Games Played": ["games played", "games"],
-  "Goals": ["goals"],
   "Blocks Placed": ["blocks placed", "blocks"],
-  "Wins": ["wins"],
-  "Losses": ["losses"],
   "Highest Winstreak": ["highest winstreak", "hws"],
   "Win Rate": ["win rate", "winrate", "wr"]
 }
 
-def match_bridge_variable(var: str) -> str:
+def duel_variables(duelmode: str) -> dict:
+  return {name: duel_aliases.get(name, [name.lower()]) for name in ["Date"] + fields.columns(duelmode) + ["Win Rate"]}
+
+def match_duel_variable(duelmode: str, var: str) -> str:
   var = var.lower()
+  variables = duel_variables(duelmode)
 
-  for key in bridge_variables:
-    if var in bridge_variables[key]:
+  for key in variables:
+    if var in variables[key]:
       return key
 
-def get_bridge_axis(df, label):
+def get_duel_axis(df, label):
   if label == "Win Rate":
     return df["Wins"] / (df["Wins"] + df["Losses"])
   else:
     return df[label]
   
-def bad_bridge_labels_embed() -> discord.Embed:
+def bad_duel_labels_embed(duelmode: str) -> discord.Embed:
   embed = discord.Embed(title="Invalid Axis Names", description="Valid axis names include the following. Aliases are provided below.", color=discord.colour.Color.blue())
-  for key in bridge_variables:
-    embed.add_field(name=key, value=f"{', '.join(bridge_variables[key])}", inline=False)
+  variables = duel_variables(duelmode)
+  for key in variables:
+    embed.add_field(name=key, value=f"{', '.join(variables[key])}", inline=False)
 
   return embed
 
-async def graph_bridge(ctx: Context, duelmode: str, uuid: str, x_label: str, y_label: str, days: int, n: int):
-  df: pd.DataFrame = databases.databases[uuid]["bridge"]
-  df = process_df(df, days, n)
-
-  y_label = match_bridge_variable(y_label)
-  x_label = match_bridge_variable(x_label)
+async def graph_duel(ctx: Context, duelmode: str, uuid: str, x_label: str, y_label: str, days: int, n: int):
+  y_label = match_duel_variable(duelmode, y_label)
+  x_label = match_duel_variable(duelmode, x_label)
 
   if x_label is None or y_label is None:
-    await ctx.respond(embed=bad_bridge_labels_embed())
+    await ctx.respond(embed=bad_duel_labels_embed(duelmode))
     return
-  
-  x_axis = get_bridge_axis(df, x_label)
-  y_axis = get_bridge_axis(df, y_label)
-
-  fig, ax = plt.subplots()
-  ax.plot(x_axis, y_axis)
 
-  fig.autofmt_xdate()
+  key = (duelmode, uuid, x_label, y_label, days, n)
+  version = databases.data_version(uuid, duelmode)
+  png = graph_cache().get(key, version)
+
+  if png is None:
+    # Computed from the columns of the wide duels table this mode needs
+    df: pd.DataFrame = graph_frame(uuid, duelmode, graph_columns(x_label, y_label), days, n)
+    if df is None or df.empty:
+      await ctx.respond(util.no_data_message(uuid, "There is no tracking data for this player yet."))
+      return
+    df = process_df(df, days, n)
+    
+    x_axis = get_duel_axis(df, x_label)
+    y_axis = get_duel_axis(df, y_label)
 
-  ax.set_title(f"Bridge Stats")
-  ax.set_ylabel(f"{y_label}")
-  ax.set_xlabel(f"{x_label}")
+    png = await render.render(x_axis.to_numpy(), y_axis.to_numpy(), f"{duelmode.capitalize()} Stats", x_label, y_label)
+    graph_cache().set(key, png, len(png), version)
 
-  fig.savefig("tmp.jpeg")
-  await ctx.respond(file=discord.File("tmp.jpeg"))
-  os.remove("tmp.jpeg")
-  
-  plt.close(fig)
\ No newline at end of file
+  await ctx.respond(file=discord.File(io.BytesIO(png), filename="graph.png"))
@@ -0,0 +1,102 @@
+import asyncio, io, os, logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from ..config import CONFIG, default_workers, fork_context
+
+"""Renders graphs in a pool of worker processes, so the event loop keeps serving commands while
+matplotlib draws and several graphs render at once on different cores.
+
+Workers import matplotlib with the Agg backend when they start and draw one throwaway figure,
+so the first real graph doesn't pay for loading fonts. Graphs are returned as PNG bytes and never
+touch the disk. matplotlib is only imported by the workers, or by this process if graphs are
+rendered in threads: where processes can't be forked, or once the pool has broken."""
+
+"""Process pool graphs are rendered in, created by warm() or the first graph."""
+_pool = None
+
+"""Set once processes can't be used for rendering, after which graphs render in threads."""
+_threaded = False
+
+
+def _init_worker():
+  import matplotlib
+  matplotlib.use("Agg")
+  render_line([0, 1], [0, 1])
+
+def _ready():
+  return os.getpid()
+
+def render_line(x, y, title="", x_label="", y_label="") -> bytes:
+  """Draws y against x and returns the figure as PNG bytes."""
+  # A Figure of its own rather than pyplot's global state, so renders in threads can't mix
+  from matplotlib.figure import Figure
+
+  fig = Figure()
+  ax = fig.subplots()
+  ax.plot(x, y)
+
+  fig.autofmt_xdate()
+
+  ax.set_title(title)
+  ax.set_ylabel(y_label)
+  ax.set_xlabel(x_label)
+
+  buffer = io.BytesIO()
+  fig.savefig(buffer, format="png")
+  return buffer.getvalue()
+
+def workers() -> int:
+  return CONFIG.GRAPH_WORKERS or default_workers(2)
+
+def render_pool() -> ProcessPoolExecutor:
+  """Returns the render pool, creating it if needed. None if graphs render in threads instead."""
+  global _pool, _threaded
+  if _threaded:
+    return None
+
+  if _pool is None:
+    context = fork_context()
+    if context is None:
+      logging.warning("Processes can't be forked on this platform. Rendering graphs in threads instead.")
+      _threaded = True
+      return None
+    _pool = ProcessPoolExecutor(max_workers=workers(), mp_context=context, initializer=_init_worker)
+  return _pool
+
+def warm():
+  """Starts every worker of the pool now, rather than when the first graphs are requested."""
+  pool = render_pool()
+  if pool is None:
+    return
+
+  for _ in range(workers()):
+    pool.submit(_ready)
+
+def shutdown_pool():
+  global _pool
+  if _pool is not None:
+    _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+async def render(x, y, title="", x_label="", y_label="") -> bytes:
+  """Renders a line graph in the pool and returns it as PNG bytes. x and y are sent to the worker, so pass arrays rather than frames."""
+  global _pool, _threaded
+  loop = asyncio.get_running_loop()
+
+  pool = render_pool()
+  if pool is None:
+    return await asyncio.to_thread(render_line, x, y, title, x_label, y_label)
+
+  try:
+    return await loop.run_in_executor(pool, render_line, x, y, title, x_label, y_label)
+  except BrokenProcessPool:
+    # A worker died, or could not import the package. A new pool would likely break the same
+    # way, so this and every later graph renders in a thread
+    if not _threaded:
+      logging.warning("Graph render pool is broken. Rendering graphs in threads from now on.")
+      _threaded = True
+    if _pool is pool:
+      pool.shutdown(wait=False, cancel_futures=True)
+      _pool = None
+    return await asyncio.to_thread(render_line, x, y, title, x_label, y_label)
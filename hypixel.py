@@ -1,6 +1,6 @@
 import discord
 from discord.ext import commands
-import sys, os, toml, requests, logging, time
+import sys, os, toml, logging, time, json, hashlib
 
 from .config import CONFIG
 
@@ -15,7 +15,7 @@ def initialize_config(dir):
     
     if not os.path.exists(f"{dir}/config.toml.default"):
       logging.error("config.toml.default not found. Please fix your configuration. Cogs will NOT be enabled.")
-      return []
+      return False
     
     with open(f"{dir}/config.toml.default", "r") as f:
       parsed_toml = toml.loads(f.read())
@@ -26,20 +26,85 @@ def initialize_config(dir):
   CONFIG.PATH = dir
   CONFIG.KEY = parsed_toml["api_key"].strip()
   CONFIG.TRACKING_ENABLED = parsed_toml["tracking"]
-  
-
-  # Check if API key is valid by requesting stats for Hypixel
-  # player with UUID f7c77d99-9f15-4a66-a87d-c4a51ef30d19
-  url = f"https://api.hypixel.net/player?key={CONFIG.KEY}&uuid=f7c77d99-9f15-4a66-a87d-c4a51ef30d19"
-  response = requests.get(url)
-  if response.status_code == 403:
-    logging.error("Invalid API key. Please check your config.toml file. Cogs will NOT be enabled.")
-    return []
-  elif response.status_code == 200 or response.status_code == 429:
+  CONFIG.REQUEST_TIMEOUT = parsed_toml.get("request_timeout", CONFIG.REQUEST_TIMEOUT)
+  CONFIG.PLAYER_CACHE_TTL = parsed_toml.get("player_cache_ttl", CONFIG.PLAYER_CACHE_TTL)
+  CONFIG.PLAYER_CACHE_SIZE = parsed_toml.get("player_cache_size", CONFIG.PLAYER_CACHE_SIZE)
+  CONFIG.RATE_LIMIT = parsed_toml.get("rate_limit", CONFIG.RATE_LIMIT)
+  CONFIG.RATE_LIMIT_WINDOW = parsed_toml.get("rate_limit_window", CONFIG.RATE_LIMIT_WINDOW)
+  CONFIG.UUID_CACHE_TTL = parsed_toml.get("uuid_cache_ttl", CONFIG.UUID_CACHE_TTL)
+  CONFIG.UUID_NEGATIVE_TTL = parsed_toml.get("uuid_negative_ttl", CONFIG.UUID_NEGATIVE_TTL)
+  CONFIG.UPDATER_CONCURRENCY = parsed_toml.get("updater_concurrency", CONFIG.UPDATER_CONCURRENCY)
+  CONFIG.SNAPSHOT_STORAGE = parsed_toml.get("snapshot_storage", CONFIG.SNAPSHOT_STORAGE)
+  CONFIG.KEYFRAME_INTERVAL = parsed_toml.get("keyframe_interval", CONFIG.KEYFRAME_INTERVAL)
+  CONFIG.COMPRESS_SNAPSHOTS = parsed_toml.get("compress_snapshots", CONFIG.COMPRESS_SNAPSHOTS)
+  CONFIG.SNAPSHOT_PROJECTION = parsed_toml.get("snapshot_projection", CONFIG.SNAPSHOT_PROJECTION)
+  CONFIG.RAW_RETENTION_DAYS = parsed_toml.get("raw_retention_days", CONFIG.RAW_RETENTION_DAYS)
+  CONFIG.REBUILD_WORKERS = parsed_toml.get("rebuild_workers", CONFIG.REBUILD_WORKERS)
+  CONFIG.REBUILD_HOUR = parsed_toml.get("rebuild_hour", CONFIG.REBUILD_HOUR)
+  CONFIG.GRAPH_POINTS = parsed_toml.get("graph_points", CONFIG.GRAPH_POINTS)
+  CONFIG.FRAME_CACHE_MB = parsed_toml.get("frame_cache_mb", CONFIG.FRAME_CACHE_MB)
+  CONFIG.GRAPH_WORKERS = parsed_toml.get("graph_workers", CONFIG.GRAPH_WORKERS)
+  CONFIG.GRAPH_CACHE_MB = parsed_toml.get("graph_cache_mb", CONFIG.GRAPH_CACHE_MB)
+
+  CONFIG.KEY_VALID = load_key_status(dir)
+  return True
+
+def _key_status_path():
+  return os.path.join(CONFIG.PATH, "data", "keystatus.json")
+
+def _key_hash():
+  return hashlib.sha256(CONFIG.KEY.encode()).hexdigest()
+
+def load_key_status(dir):
+  """Returns the last validation result for the configured key, or None if it has not been checked."""
+  try:
+    with open(os.path.join(dir, "data", "keystatus.json"), "r") as f:
+      status = json.load(f)
+  except (OSError, ValueError):
+    return None
+
+  if status.get("key") != _key_hash():
+    return None
+
+  return status.get("valid")
+
+async def validate_key():
+  """
+  Checks the API key against Hypixel in the background once the bot is ready. The result is cached
+  in data/keystatus.json so restarts use it straight away, and is refreshed when older than
+  KEY_CHECK_INTERVAL. An invalid key leaves the cogs loaded but degraded to tracked data only.
+  """
+  from . import api
+
+  try:
+    with open(_key_status_path(), "r") as f:
+      status = json.load(f)
+    if status.get("key") == _key_hash() and time.time() - status.get("checked", 0) < CONFIG.KEY_CHECK_INTERVAL:
+      return
+  except (OSError, ValueError):
+    pass
+
+  try:
+    valid = await api.check_key()
+  except Exception as e:
+    logging.warning(f"Could not validate API key: {e}")
+    return
+
+  if valid is None:
+    logging.warning("API key check was inconclusive. Keeping the last known status.")
+    return
+
+  CONFIG.KEY_VALID = valid
+  if valid:
     logging.info("API key is valid.")
   else:
-    logging.error(f"Unexpected error: {response.status_code}. Cogs will NOT be enabled.")
-    return []
+    logging.error("Invalid API key. Please check your config.toml file. Live stats commands are disabled.")
+
+  try:
+    with open(_key_status_path(), "w") as f:
+      json.dump({"key": _key_hash(), "valid": valid, "checked": time.time()}, f)
+  except OSError as e:
+    logging.error(f"Could not save API key status: {e}")
 
 def get_intents() -> discord.Intents:
   intents = discord.Intents.default()
@@ -52,7 +117,10 @@ def get_cogs(client: commands.Bot, dir: str) -> list:
   from .gamemodes.duels import Duels
   from .graph.graph_cog import Graph
   from .util import Util
-  initialize_config(dir)
+  if not initialize_config(dir):
+    return []
+
+  client.add_listener(validate_key, "on_ready")
 
   return [
     Bedwars(client),
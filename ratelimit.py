@@ -0,0 +1,121 @@
+import asyncio, heapq, itertools, time
+
+"""Request priorities. Lower values are dispatched first."""
+INTERACTIVE = 0
+BACKGROUND  = 1
+
+
+def header_int(headers, name):
+  try:
+    return int(headers[name])
+  except (KeyError, TypeError, ValueError):
+    return None
+
+
+class RequestScheduler():
+  """
+  Token bucket for an API key's rate limit. Requests wait in a priority queue until a token is
+  available, and the bucket is corrected from the RateLimit-* headers on every response.
+  """
+  def __init__(self, limit: int, window: float):
+    self.limit     = limit
+    self.window    = window
+    self.remaining = limit
+    self.reset_at  = time.monotonic() + window
+
+    self._queue      = []
+    self._seq        = itertools.count()
+    self._dispatcher = None
+    self._in_flight  = 0
+
+    self.dispatched = 0
+    self.retries    = 0
+    self.total_wait = 0.0
+    self.max_wait   = 0.0
+
+  def _refill(self):
+    now = time.monotonic()
+    if now >= self.reset_at:
+      self.remaining = self.limit
+      self.reset_at  = now + self.window
+
+  def _grant(self, enqueued):
+    waited = time.monotonic() - enqueued
+
+    self.remaining  -= 1
+    self._in_flight += 1
+    self.dispatched += 1
+    self.total_wait += waited
+    self.max_wait    = max(self.max_wait, waited)
+
+  async def acquire(self, priority=INTERACTIVE):
+    """Waits until a request of the given priority may be sent."""
+    self._refill()
+    if not self._queue and self.remaining > 0:
+      self._grant(time.monotonic())
+      return
+
+    future = asyncio.get_running_loop().create_future()
+    heapq.heappush(self._queue, (priority, next(self._seq), time.monotonic(), future))
+
+    if self._dispatcher is None:
+      self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    await future
+
+  async def _dispatch(self):
+    while self._queue:
+      self._refill()
+      if self.remaining <= 0:
+        await asyncio.sleep(max(self.reset_at - time.monotonic(), 0.05))
+        continue
+
+      _, _, enqueued, future = heapq.heappop(self._queue)
+      if future.cancelled():
+        continue
+
+      self._grant(enqueued)
+      future.set_result(None)
+
+    self._dispatcher = None
+
+  def release(self, headers=None):
+    """Marks a granted request as finished and syncs the bucket with the response's RateLimit headers."""
+    self._in_flight = max(self._in_flight - 1, 0)
+    if headers is None:
+      return
+
+    limit     = header_int(headers, "RateLimit-Limit")
+    remaining = header_int(headers, "RateLimit-Remaining")
+    reset     = header_int(headers, "RateLimit-Reset")
+
+    if limit is not None:
+      self.limit = limit
+    if remaining is not None:
+      # Requests still in flight were granted against the old count and will spend tokens too
+      self.remaining = max(remaining - self._in_flight, 0)
+    if reset is not None:
+      self.reset_at = time.monotonic() + reset
+
+  def throttle(self, retry_after=None):
+    """Empties the bucket after a 429 so nothing else is sent until the window resets."""
+    self.remaining = 0
+    self.retries  += 1
+
+    if retry_after is not None:
+      self.reset_at = time.monotonic() + retry_after
+
+  def stats(self) -> dict:
+    """Returns queue depth and wait time statistics."""
+    return {
+      "queued"            : len(self._queue),
+      "queued_interactive": sum(1 for entry in self._queue if entry[0] == INTERACTIVE),
+      "queued_background" : sum(1 for entry in self._queue if entry[0] != INTERACTIVE),
+      "in_flight"         : self._in_flight,
+      "remaining"         : self.remaining,
+      "reset_in"          : max(self.reset_at - time.monotonic(), 0),
+      "dispatched"        : self.dispatched,
+      "retries"           : self.retries,
+      "average_wait"      : self.total_wait / self.dispatched if self.dispatched else 0,
+      "max_wait"          : self.max_wait
+    }
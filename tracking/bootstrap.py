@@ -0,0 +1,20 @@
+import importlib.util
+import sys
+
+from pathlib import Path
+
+# Have to go up one directory becuase this is in tracking, not root
+ROOT = Path(__file__).parents[1].absolute()
+
+def load_package():
+  """
+  The scripts in tracking/ run standalone, but share the API client and snapshot code with the
+  cogs. The module directory (sprocket-hypixel) is not a valid package name, so import it by path.
+  """
+  if "sprocket_hypixel" in sys.modules:
+    return
+
+  spec = importlib.util.spec_from_file_location("sprocket_hypixel", ROOT / "__init__.py", submodule_search_locations=[str(ROOT)])
+  package = importlib.util.module_from_spec(spec)
+  sys.modules["sprocket_hypixel"] = package
+  spec.loader.exec_module(package)
@@ -0,0 +1,146 @@
+import os, json, sqlite3, datetime, threading
+
+"""SQLite index of the snapshots in data/trackedplayers, stored in data/snapshots.sqlite3.
+
+Every tracked day of every player has a row mapping it to the date whose file holds its
+snapshot (the same date, or an earlier one for days that were unchanged) and that file's
+name. The primary key doubles as the (uuid, day) index, so looking up a date, the nearest
+earlier snapshot or a player's whole history is a single indexed query. The files stay the
+source of truth: a player's rows can always be rebuilt from their directory with index_player."""
+
+DATE_FORMAT = "%d-%m-%y"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+  uuid   TEXT NOT NULL,
+  day    TEXT NOT NULL,
+  stored TEXT NOT NULL,
+  file   TEXT NOT NULL,
+  PRIMARY KEY (uuid, day)
+) WITHOUT ROWID
+"""
+
+_local = threading.local()
+_indexed = set()
+
+
+def _iso(date_str):
+  return datetime.datetime.strptime(date_str, DATE_FORMAT).strftime("%Y-%m-%d")
+
+def _from_iso(day):
+  return datetime.datetime.strptime(day, "%Y-%m-%d").strftime(DATE_FORMAT)
+
+def catalog_path(directory):
+  return os.path.join(directory, "data", "snapshots.sqlite3")
+
+def connect(directory) -> sqlite3.Connection:
+  """Returns this thread's connection to the catalog, creating the database if needed."""
+  path = catalog_path(directory)
+  # A forked rebuild worker must not share its parent's connections
+  connections = getattr(_local, "connections", None)
+  if connections is None or _local.pid != os.getpid():
+    connections = _local.connections = {}
+    _local.pid = os.getpid()
+
+  if path not in connections:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30)
+    # WAL lets the bot keep reading while the updater writes
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(SCHEMA)
+    connections[path] = connection
+
+  return connections[path]
+
+def record(directory, uuid, date_str, stored_str, filename):
+  """Records that the snapshot for date_str is held in filename, stored under stored_str."""
+  connection = connect(directory)
+  with connection:
+    connection.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)", (uuid, _iso(date_str), stored_str, filename))
+
+def index_player(directory, uuid):
+  """Rebuilds a player's rows from the files in their directory and mapping.json."""
+  from . import snapshots
+
+  wkdir = snapshots.player_dir(directory, uuid)
+  rows = []
+  files = {}
+
+  if os.path.isdir(wkdir):
+    for date_str in snapshots.list_dates(wkdir):
+      files[date_str] = os.path.basename(snapshots._locate(wkdir, date_str)[0])
+      rows.append((uuid, _iso(date_str), date_str, files[date_str]))
+
+    mapping_filepath = os.path.join(wkdir, "mapping.json")
+    if os.path.exists(mapping_filepath):
+      with open(mapping_filepath, "r") as f:
+        mapping = json.load(f)
+
+      for date_str, stored in mapping.items():
+        if stored in files and date_str not in files:
+          rows.append((uuid, _iso(date_str), stored, files[stored]))
+
+  connection = connect(directory)
+  with connection:
+    connection.execute("DELETE FROM snapshots WHERE uuid = ?", (uuid,))
+    connection.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)", rows)
+
+  _indexed.add((catalog_path(directory), uuid))
+
+def ensure_indexed(directory, uuid):
+  """Indexes a player from their files the first time they are looked up if the catalog has no rows for them."""
+  key = (catalog_path(directory), uuid)
+  if key in _indexed:
+    return
+
+  if connect(directory).execute("SELECT 1 FROM snapshots WHERE uuid = ? LIMIT 1", (uuid,)).fetchone() is None:
+    index_player(directory, uuid)
+  _indexed.add(key)
+
+def lookup(directory, uuid, date_str, nearest=False):
+  """
+  Returns (stored date, file name) of the snapshot for a date, or None if there is none. With
+  nearest=True, falls back to the closest earlier tracked day.
+  """
+  ensure_indexed(directory, uuid)
+
+  if nearest:
+    query = "SELECT stored, file FROM snapshots WHERE uuid = ? AND day <= ? ORDER BY day DESC LIMIT 1"
+  else:
+    query = "SELECT stored, file FROM snapshots WHERE uuid = ? AND day = ?"
+
+  return connect(directory).execute(query, (uuid, _iso(date_str))).fetchone()
+
+def stored_files(directory, uuid, after=None) -> list:
+  """Returns (date, file name) for every day that has its own snapshot file, oldest first. Only days after `after` if given."""
+  ensure_indexed(directory, uuid)
+
+  after = _iso(after) if after is not None else ""
+  rows = connect(directory).execute("SELECT day, stored, file FROM snapshots WHERE uuid = ? AND day > ? ORDER BY day", (uuid, after))
+  return [(stored, filename) for day, stored, filename in rows if _from_iso(day) == stored]
+
+def last_days(directory) -> dict:
+  """Returns the last tracked day of every player in the catalog, in one query."""
+  rows = connect(directory).execute("SELECT uuid, MAX(day) FROM snapshots GROUP BY uuid")
+  return {uuid: _from_iso(day) for uuid, day in rows}
+
+def tracked_days(directory, uuid, after=None) -> list:
+  """Returns every day that has a snapshot, including days mapped to an earlier one, oldest first. Only days after `after` if given."""
+  ensure_indexed(directory, uuid)
+
+  after = _iso(after) if after is not None else ""
+  return [_from_iso(row[0]) for row in connect(directory).execute("SELECT day FROM snapshots WHERE uuid = ? AND day > ? ORDER BY day", (uuid, after))]
+
+def gaps(directory, uuid) -> list:
+  """Returns the days between a player's first and last snapshot that have no snapshot, oldest first."""
+  ensure_indexed(directory, uuid)
+
+  days = [row[0] for row in connect(directory).execute("SELECT day FROM snapshots WHERE uuid = ? ORDER BY day", (uuid,))]
+  missing = []
+  for previous, current in zip(days, days[1:]):
+    day = datetime.date.fromisoformat(previous) + datetime.timedelta(days=1)
+    while day < datetime.date.fromisoformat(current):
+      missing.append(day.strftime(DATE_FORMAT))
+      day += datetime.timedelta(days=1)
+
+  return missing
@@ -1,188 +1,464 @@
-import asyncio, os, json, logging
+import asyncio, os, json, logging, hashlib
 import datetime
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
-from ..config import CONFIG
-from .. import util
+from ..config import CONFIG, default_workers, fork_context
+from ..cache import SizedLRUCache
+from .. import fields
+from . import catalog, snapshots, store
 
-"""Player UUIDs are keys. Values are another dict which has
-keys representing the different gamemodes
-e.g. databases[uuid]['bedwars'] will give the bedwars database for the player uuid"""
-databases = {}
+# pandas is imported inside the functions that need it so loading the module with
+# tracking disabled stays cheap
 
+"""Stat tables every tracked player has: one per mode outside Duels, and the wide duels table the duel modes are computed from."""
+MODES = [mode for mode in fields.MODES if mode not in fields.DUEL_MODES] + ["duels"]
 
-def getJSON(date: datetime.datetime, uuid=None, username=None):
-    PATH = CONFIG.PATH
+"""Suffix of the tables holding each day's gains, e.g. bedwars_daily for bedwars."""
+DAILY = "_daily"
 
-    # Determine UUID
-    if uuid is not None:
-        real_uuid = uuid
-    elif username is not None:
-        real_uuid = util.getUUID(username)
-        if real_uuid == 1:
-            return None
-    else:
-        return None
-
-    wkdir = os.path.join(PATH, "data", "trackedplayers", real_uuid)
-    date_str = date.strftime("%d-%m-%y")
-    filepath = os.path.join(wkdir, f"{date_str}.json")
-
-    # If exact file doesn't exist, try mapping.json
-    if not os.path.exists(filepath):
-        mapping_path = os.path.join(wkdir, "mapping.json")
-        if not os.path.exists(mapping_path):
-            logging.error(f"Mapping file not found: {mapping_path}")
-            return None
-
-        with open(mapping_path, "r") as f:
-            mapping = json.load(f)
-
-        if date_str not in mapping:
-            logging.error(f"No mapping for date {date_str}")
-            return None
-
-        mapped_date = mapping[date_str]
-        if mapped_date is None:
-            logging.error(f"No valid fallback for date {date_str}")
-            return None
-
-        filepath = os.path.join(wkdir, f"{mapped_date}.json")
-        if not os.path.exists(filepath):
-            logging.error(f"Mapped file {filepath} does not exist.")
-            return None
-
-    # Load and return JSON
-    with open(filepath, "r") as f:
-        return json.load(f)
-
-# Helper to make adding new modes easier
-def sum_stats(stats_dict, prefixes, suffix):
-  total = 0
-  for p in prefixes:
-      key = f"{p}_{suffix}"
-      val = stats_dict.get(key, 0)
-      # Handle cases where the key exists but the value is None
-      total += (val if val is not None else 0)
-  return total
-
-# TODO more elegant solution?
-def normalizeJSON(datatype, json):
-  if datatype == "bedwars":
-    kills = json["player"]["stats"]["Bedwars"]["kills_bedwars"]
-    deaths = json["player"]["stats"]["Bedwars"]["deaths_bedwars"]
-    voidDeaths = json["player"]["stats"]["Bedwars"]["void_deaths_bedwars"]
-    finalDeaths = json["player"]["stats"]["Bedwars"]["final_deaths_bedwars"]
-    finalKills = json["player"]["stats"]["Bedwars"]["final_kills_bedwars"]
-    bedwarsLevel = json["player"]["achievements"]["bedwars_level"]
-    bedsBroken = json["player"]["stats"]["Bedwars"]["beds_broken_bedwars"]
-    gamesplayed = json["player"]["stats"]["Bedwars"]["games_played_bedwars"]
-    wins = json["player"]["stats"]["Bedwars"]["wins_bedwars"]
-    losses = json["player"]["stats"]["Bedwars"]["losses_bedwars"]
-    kdr = kills / deaths
-    finalkdr = finalKills / finalDeaths
-    
-    return {
-      "Date": json["date"],
-      "Kills": kills,
-      "Deaths": deaths,
-      "Void Deaths": voidDeaths,
-      "Final Deaths": finalDeaths,
-      "Final Kills": finalKills,
-      "Beds Broken": bedsBroken,
-      "Bedwars Level": bedwarsLevel,
-      "Games Played": gamesplayed,
-      "Wins": wins,
-      "Losses": losses,
-      #"Win Streak": winstreak,
-      "K/D Ratio": kdr,
-      "Final K/D Ratio": finalkdr
-    }
-  
-  elif datatype == "bridge":
-    player_stats = json["player"]["stats"]["Duels"]
-    username = json["player"]["displayname"]
-
-    modes = ["bridge_duel", "bridge_doubles", "bridge_threes", "bridge_four", "bridge_3v3v3v3"]
-
-    wins          = sum_stats(player_stats, modes, "wins")
-    losses        = sum_stats(player_stats, modes, "losses")
-    goals         = sum_stats(player_stats, modes, "goals")
-    kills         = sum_stats(player_stats, modes, "bridge_kills")
-    deaths        = sum_stats(player_stats, modes, "bridge_deaths")
-    blocks_placed = sum_stats(player_stats, modes, "blocks_placed")
-
-    games_played = wins + losses
-
-    # TODO handle this better
-    highest_winstreak = player_stats.get("best_bridge_winstreak", -1)
-    winstreak = player_stats.get("current_bridge_winstreak", -1)
-
-
-    return {
-      'Date'             : json["date"],
-      'Wins'             : wins,
-      'Losses'           : losses,
-      'Kills'            : kills,
-      'Deaths'           : deaths,
-      'Games Played'     : games_played,
-      'Goals'            : goals,
-      'Blocks Placed'    : blocks_placed,
-      'Highest Winstreak': highest_winstreak,
-      'Winstreak'        : winstreak,
-    }
-
-
-def rebuild_database_worker(player):
-  path = CONFIG.PATH + "/data/"
-
-  PLAYERPATH = f"{path}/trackedplayers/{player}"
-  json_list = os.listdir(PLAYERPATH)
-  json_list.remove("mapping.json")
-  json_files = [f.replace(".json", "") for f in json_list if f.endswith(".json")]
-  json_files.sort(key=lambda x : datetime.datetime.strptime(x, "%d-%m-%y"))
-  json_files = [f + ".json" for f in json_files]
-
-  data = {
-     'bedwars': [],
-     'bridge': []
-  }
-  failed = 0
-  for filename in json_files:
-    with open(os.path.join(PLAYERPATH, filename), "r") as file:
-      json_data = json.load(file)
-      json_data["date"] = filename.removesuffix(".json")
+"""Suffixes of the rollup tables, which keep the last row of each week or month of a stat table, and the pandas period of each."""
+ROLLUPS = {"_weekly": "W", "_monthly": "M"}
 
-      if json_data["success"] != True:
-        failed += 1
-        continue
-      
-      for gamemode in data:
-        dat = normalizeJSON(gamemode, json_data)
-        data[gamemode].append(dat)
+"""Days between the rows of a stat table ("") and of each rollup, finest first."""
+RESOLUTION_DAYS = {"": 1, "_weekly": 7, "_monthly": 30}
 
-  for gamemode in data:
-    data[gamemode] = pd.DataFrame(data[gamemode])
-    # add _p{uuid} so it doesn't complain about invalid identifiers
-    data[gamemode].to_hdf(CONFIG.PATH + f"/data/databases/{player}/{gamemode}.h5", key=f"p_{player}")
-  return data
+def table_columns(mode) -> list:
+  """Returns the columns of a table, or None for the duels table, which gains columns as new counters appear."""
+  if mode == "duels":
+    return None
+  return fields.INFO + fields.columns(mode)
 
+def _table(mode):
+  return "duels" if mode in fields.DUEL_MODES else mode
 
-async def rebuild_db(player):
-  result = await asyncio.to_thread(rebuild_database_worker, player)
-  databases[player] = result
+"""Process pool the stat tables are rebuilt in, created on the first rebuild."""
+_pool = None
 
-  logging.info(f"Sucessfully rebuilt database for {player}")
+"""Set once processes can't be used for rebuilds, after which they run in threads."""
+_threaded = False
 
-async def rebuild_dbs(PATH):
-  logging.info("Rebuilding databeses.")
-  players = [player.removesuffix("\n") for player in open(PATH + "/data/trackedplayers.txt").readlines()]
-  PATH = PATH + "/data/trackedplayers"
-  DATE = datetime.datetime.now().strftime("%d-%m-%y")
+"""Frames decoded by get_frame, kept within frame_cache_mb. Created on first use."""
+_frames = None
+
+"""Warm start of the tables, or None before the first. Kept so it can be awaited and cancelled."""
+_warm = None
+
+"""The daily_scheduler task, started once the bot is ready."""
+_scheduler = None
+
+"""Players whose tables the warm start is bringing up to date, and those it could not."""
+LOADING = "loading"
+FAILED = "failed"
+_status = {}
 
-  tasks = [asyncio.create_task(rebuild_db(player)) for player in players]
 
-  await asyncio.gather(*tasks)
+def rebuild_database_worker(player, directory=None, full=False):
+  """
+  Brings a player's stat tables up to date with their snapshots and returns the number of rows
+  written per mode. Only snapshots after each table's high-water mark are parsed and appended,
+  unless full is set or a table has no mark, in which case it is rebuilt from scratch. Runs in a
+  worker process, so the directory is passed in rather than read from CONFIG.
+  """
+  import pandas as pd
+
+  directory = directory or CONFIG.PATH
+  # A table whose columns no longer match the registry has no mark, so it is rebuilt
+  marks = {mode: None if full else store.read_mark(directory, player, mode, table_columns(mode)) for mode in MODES}
+  after = None if None in marks.values() else min(marks.values(), key=snapshots._parse_date)
+
+  data = {mode: [] for mode in MODES}
+  last = None
+  failed = 0
+  for date_str, json_data in snapshots.iter_snapshots(directory, player, after):
+    last = date_str
+
+    if json_data["success"] != True:
+      failed += 1
+      continue
+
+    # Every mode's columns come out of one pass over the document
+    extracted = fields.extract(json_data, [mode for mode in MODES if mode != "duels"], derived=False)
+    extracted["duels"] = fields.duels_counters(json_data)
+    for gamemode in data:
+      # Tables that were already further along than `after` skip the rows they have
+      if marks[gamemode] is not None and snapshots._parse_date(date_str) <= snapshots._parse_date(marks[gamemode]):
+        continue
+      data[gamemode].append({"Date": date_str, "Display Name": (json_data.get("player") or {}).get("displayname", ""), **extracted[gamemode]})
+
+  # Columns not kept in the tables are dropped here. The frames stay in this process, only the row counts are sent back
+  rows = {}
+  for gamemode in data:
+    rows[gamemode] = len(data[gamemode])
+    if gamemode == "duels":
+      # A player with no snapshots yet still gets the Date column lookups bisect over
+      df = pd.DataFrame(data[gamemode]) if data[gamemode] else pd.DataFrame(columns=fields.INFO)
+    else:
+      # Ratios are computed over the whole column rather than row by row
+      df = fields.derive(gamemode, pd.DataFrame(data[gamemode], columns=fields.INFO + fields.columns(gamemode, stored=False)))[table_columns(gamemode)]
+    fill = fields.fill_duels if gamemode == "duels" else None
+
+    if marks[gamemode] is None:
+      store.write_frame(directory, player, gamemode, fill(df) if fill else df, last)
+    elif last is not None:
+      store.append_frame(directory, player, gamemode, df, last, fill)
+
+    update_daily(directory, player, gamemode, full=marks[gamemode] is None)
+    update_rollups(directory, player, gamemode, full=marks[gamemode] is None)
+  return rows
+
+def _gains(table, cumulative):
+  """
+  Returns each row of a stat table minus the row before it, indexed like cumulative. Counters are
+  differenced, current values like winstreaks are kept and ratios are recomputed from the gains.
+  The first row has no gains and is NaN.
+  """
+  import pandas as pd
+
+  counters = [column for column in cumulative.columns if not fields.is_state(column) and pd.api.types.is_numeric_dtype(cumulative[column])]
+  gains = pd.concat([cumulative.drop(columns=counters), cumulative[counters].diff()], axis=1)
+
+  if table != "duels":
+    # Ratios of the gains, not differences of the running ratios
+    gains = fields.derive(table, gains)
+  return gains[cumulative.columns]
+
+def _restore_types(gains, df):
+  return gains.astype({column: df[column].dtype for column in df.columns if df[column].dtype.kind == "i" and column in gains and not gains[column].isna().any()})
+
+def daily_frame(table, df, days):
+  """
+  Returns the gains of each tracked day over the day before it, computed from a stat table.
+  Unchanged days, which have no row of their own, gain nothing. Days whose previous day was not
+  tracked are left out, so a row never covers more than one day.
+  """
+  import pandas as pd
+
+  cumulative = df.set_index("Date").reindex(days).ffill().dropna(how="all")
+  gains = _gains(table, cumulative)
+
+  dates = pd.to_datetime(cumulative.index.to_series(), format=snapshots.DATE_FORMAT)
+  gains = gains[(dates.diff() == pd.Timedelta(days=1)).to_numpy()]
+
+  return _restore_types(gains.rename_axis("Date").reset_index()[df.columns], df)
+
+def update_daily(directory, player, table, full=False):
+  """
+  Brings a player's daily table up to date with their stat table. Only the days tracked since the
+  daily table's mark are computed, from the stat rows from the one on or before the mark, and
+  appended. The table is rebuilt from the whole stat table if full is set or it has no mark.
+  """
+  daily = table + DAILY
+  mark = None if full else store.read_mark(directory, player, daily, table_columns(table))
+  index = None if mark is None else store.find_before(directory, player, table, snapshots._parse_date(mark))
+
+  if index is None:
+    days = catalog.tracked_days(directory, player)
+    df = store.read_frame(directory, player, table)
+    if days and df is not None:
+      store.write_frame(directory, player, daily, daily_frame(table, df, days), days[-1])
+    return
+
+  days = catalog.tracked_days(directory, player, after=mark)
+  if not days:
+    return
+
+  # The row holding the mark's stats is dated on the day it was stored, which is earlier if the
+  # mark was an unchanged day. It is only there to difference the first new day against
+  df = store.read_frame(directory, player, table, start=index)
+  df.loc[0, "Date"] = mark
+  store.append_frame(directory, player, daily, daily_frame(table, df, [mark] + days), days[-1], fields.fill_duels if table == "duels" else None)
+
+def rollup_frame(df, period):
+  """Returns the last row of each period ("W" or "M") of a stat table. The stats are running totals, so that row holds the whole period."""
+  import pandas as pd
+
+  periods = pd.to_datetime(df["Date"], format=snapshots.DATE_FORMAT).dt.to_period(period)
+  return df[~periods.duplicated(keep="last").to_numpy()]
+
+def update_rollups(directory, player, table, full=False):
+  """
+  Brings a player's weekly and monthly rollups of a stat table up to date with it. Only the rows
+  added since a rollup's mark are read and regrouped with its last period, which they may extend.
+  A rollup is rebuilt from the whole table if full is set or it has no mark.
+  """
+  import pandas as pd
+
+  mark = store.read_mark(directory, player, table)
+  if mark is None:
+    return
+
+  for suffix, period in ROLLUPS.items():
+    rollup = table + suffix
+    rolled = None if full else store.read_mark(directory, player, rollup, table_columns(table))
+    if rolled == mark:
+      continue
+
+    index = None if rolled is None else store.find_before(directory, player, table, snapshots._parse_date(rolled))
+    if index is None:
+      df = store.read_frame(directory, player, table)
+    else:
+      df = pd.concat([store.read_frame(directory, player, rollup), store.read_frame(directory, player, table, start=index + 1)], ignore_index=True)
+      if table == "duels":
+        # New rows can bring counters the rollup has no column for yet
+        df = fields.fill_duels(df)
+
+    store.write_frame(directory, player, rollup, rollup_frame(df, period), mark)
+
+def frame_cache() -> SizedLRUCache:
+  global _frames
+
+  if _frames is None:
+    _frames = SizedLRUCache(int(CONFIG.FRAME_CACHE_MB * 1024 * 1024))
+  return _frames
+
+def compact(df):
+  """
+  Returns a frame with its dates parsed and its numbers in the smallest types that commonly hold
+  them: int32 counters where they fit and float32 ratios.
+  """
+  import numpy as np
+  import pandas as pd
+
+  types = {}
+  for column in df.columns:
+    kind = df[column].dtype.kind
+    if kind == "i" and (len(df) == 0 or (df[column].min() >= np.iinfo(np.int32).min and df[column].max() <= np.iinfo(np.int32).max)):
+      types[column] = "int32"
+    elif kind == "f":
+      types[column] = "float32"
+
+  df = df.astype(types)
+  if "Date" in df:
+    df["Date"] = pd.to_datetime(df["Date"], format=snapshots.DATE_FORMAT)
+  return df
+
+def index_frame(df):
+  """
+  Returns a frame sorted by date with a DatetimeIndex of its dates, without the rows whose numbers
+  are all the same as the row before, so graphs can window it with a binary search.
+  """
+  if "Date" not in df:
+    return df
+
+  df = df.sort_values("Date", kind="stable")
+  numbers = df.select_dtypes(include=["number"])
+  changed = (numbers != numbers.shift()).any(axis=1).to_numpy()
+
+  df = df[changed]
+  return df.set_index(df["Date"].rename(None))
+
+def _read_frame(uuid, mode, columns, resolution):
+  if mode not in fields.DUEL_MODES:
+    return store.read_frame(CONFIG.PATH, uuid, mode + resolution, columns)
+
+  wide = store.read_frame(CONFIG.PATH, uuid, "duels" + resolution, fields.INFO + fields.raw_columns(mode, columns))
+  if wide is None:
+    return None
+  return fields.aggregate(mode, wide, columns)
+
+def get_frame(uuid, mode, columns=None, resolution=""):
+  """
+  Returns a player's stat table for a mode, or the rollup with the given resolution suffix, with
+  only the given columns. Duel modes are computed from the columns of the duels table they need.
+  None if it has not been built.
+
+  Frames are decoded on first use with compact types, indexed by date with unchanged rows dropped
+  (see index_frame), and kept in the frame cache until the table is rewritten or the cache needs
+  the room. The frame returned is the cached one, shared between callers, and must not be modified.
+  """
+  version = store.frame_version(CONFIG.PATH, uuid, _table(mode) + resolution)
+  if version is None:
+    return None
+
+  key = (uuid, mode, resolution, tuple(columns) if columns is not None else None)
+  df = frame_cache().get(key, version)
+  if df is None:
+    df = index_frame(compact(_read_frame(uuid, mode, columns, resolution)))
+    frame_cache().set(key, df, int(df.memory_usage(deep=True).sum()), version)
+
+  return df
+
+def cache_stats() -> dict:
+  """Returns the frame cache's entry count, size and budget in bytes, hits, misses and evictions."""
+  return frame_cache().stats()
+
+def data_version(uuid, mode) -> tuple:
+  """
+  Returns a value that changes whenever a rebuild writes new rows to any table a mode is graphed
+  from. Those rebuilds run when the updater finishes and at rebuild_hour, so a snapshot the
+  updater ingests changes the version of every table it adds rows to.
+  """
+  return tuple(store.frame_version(CONFIG.PATH, uuid, _table(mode) + suffix) for suffix in RESOLUTION_DAYS)
+
+def resolution(uuid, mode, days=0) -> str:
+  """
+  Returns the suffix of the finest table that covers a player's last `days` days of tracking, or
+  their whole history if 0, in at most graph_points rows. The coarsest built one if none does.
+  """
+  table = _table(mode)
+  span = store.date_span(CONFIG.PATH, uuid, table)
+  if span is None:
+    return ""
+
+  window = days if days > 0 else (span[1] - span[0]).days
+  built = [suffix for suffix in RESOLUTION_DAYS if suffix == "" or store.has_frame(CONFIG.PATH, uuid, table + suffix)]
+  return next((suffix for suffix in built if window / RESOLUTION_DAYS[suffix] <= CONFIG.GRAPH_POINTS), built[-1])
+
+def get_window(uuid, mode, columns=None, days=0):
+  """
+  Returns the frame to graph a player's last `days` days of tracking from, or their whole history
+  if 0, at the resolution picked by resolution(). Shared like get_frame's. None if the table has
+  not been built.
+  """
+  return get_frame(uuid, mode, columns, resolution(uuid, mode, days))
+
+def _raw_row(uuid, mode, table, index):
+  # Duel modes only read the wide columns they are computed from
+  columns = fields.INFO + fields.raw_columns(mode) if mode in fields.DUEL_MODES else None
+  return store.read_row(CONFIG.PATH, uuid, table, index, columns)
+
+def _mode_rows(mode, rows) -> list:
+  import pandas as pd
+
+  if mode not in fields.DUEL_MODES:
+    return rows
+  return fields.aggregate(mode, pd.DataFrame(rows)).to_dict("records")
+
+def _read_row(uuid, mode, table, index):
+  if index is None:
+    return None
+  return _mode_rows(mode, [_raw_row(uuid, mode, table, index)])[0]
+
+def get_day(uuid, mode, date: datetime.datetime) -> dict:
+  """Returns the stats a player gained in a mode on a date, one row of the daily table. None if the date or the day before it was not tracked."""
+  table = _table(mode) + DAILY
+  return _read_row(uuid, mode, table, store.find_row(CONFIG.PATH, uuid, table, date.strftime(snapshots.DATE_FORMAT)))
+
+def get_row_on(uuid, mode, date: datetime.datetime) -> dict:
+  """
+  Returns a player's stats in a mode from the snapshot of a date. None if the date wasn't tracked
+  or the tables haven't been brought up to date with it yet.
+  """
+  entry = catalog.lookup(CONFIG.PATH, uuid, date.strftime(snapshots.DATE_FORMAT))
+  if entry is None:
+    return None
+
+  # Unchanged days are stored under the earlier day they match
+  table = _table(mode)
+  return _read_row(uuid, mode, table, store.find_row(CONFIG.PATH, uuid, table, entry[0]))
+
+def get_row(uuid, mode, date: datetime.datetime) -> dict:
+  """Returns a player's stats in a mode as of a date, from the closest snapshot on or before it. None if there is none."""
+  table = _table(mode)
+  return _read_row(uuid, mode, table, store.find_before(CONFIG.PATH, uuid, table, date))
+
+def get_range(uuid, mode, start: datetime.datetime, end: datetime.datetime) -> dict:
+  """
+  Returns the stats a player gained in a mode between two dates, as the difference of the closest
+  snapshots on or before each. A start before the first snapshot uses the first one. Both rows are
+  found by binary search, so this takes the same time however long the history is. The result's
+  "Start" and "Date" are the dates of the snapshots used. None if there is nothing before end.
+  """
+  import pandas as pd
+
+  table = _table(mode)
+  end_index = store.find_before(CONFIG.PATH, uuid, table, end)
+  if end_index is None:
+    return None
+  start_index = store.find_before(CONFIG.PATH, uuid, table, start) or 0
+
+  raw = pd.DataFrame([_raw_row(uuid, mode, table, start_index), _raw_row(uuid, mode, table, end_index)])
+  gains = _restore_types(_gains(table, raw).iloc[1:], raw)
+
+  row = _mode_rows(mode, gains.to_dict("records"))[0]
+  row["Start"] = raw["Date"].iloc[0]
+  return row
+
+
+def range_dates(row) -> tuple:
+  """Returns the dates of the first and last snapshot a row from get_range covers, which can be inside the dates asked for."""
+  return snapshots._parse_date(row["Start"]), snapshots._parse_date(row["Date"])
+
+def rebuild_pool() -> ProcessPoolExecutor:
+  """Returns the rebuild pool, creating it if needed. None if rebuilds run in threads instead."""
+  global _pool, _threaded
+  if _threaded:
+    return None
+
+  if _pool is None:
+    context = fork_context()
+    if context is None:
+      logging.warning("Processes can't be forked on this platform. Rebuilding in threads instead.")
+      _threaded = True
+      return None
+    _pool = ProcessPoolExecutor(max_workers=CONFIG.REBUILD_WORKERS or default_workers(4), mp_context=context)
+  return _pool
+
+def shutdown_pool():
+  global _pool
+  if _warm is not None:
+    _warm.cancel()
+  if _pool is not None:
+    _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+async def rebuild_db(player, full=False):
+  """
+  Updates a player's stat tables in the process pool, from scratch if full is set. Returns the
+  number of rows written per mode.
+  """
+  global _pool, _threaded
+  loop = asyncio.get_running_loop()
+
+  pool = rebuild_pool()
+  try:
+    if pool is None:
+      rows = await asyncio.to_thread(rebuild_database_worker, player, CONFIG.PATH, full)
+    else:
+      rows = await loop.run_in_executor(pool, rebuild_database_worker, player, CONFIG.PATH, full)
+  except BrokenProcessPool:
+    # A worker died, or could not import the package. A new pool would likely break the same
+    # way, so this and every later rebuild runs in a thread
+    if not _threaded:
+      logging.warning(f"Rebuild process pool is broken. Rebuilding in threads from now on.")
+      _threaded = True
+    if _pool is pool:
+      pool.shutdown(wait=False, cancel_futures=True)
+      _pool = None
+    rows = await asyncio.to_thread(rebuild_database_worker, player, CONFIG.PATH, full)
+
+  logging.info(f"Sucessfully rebuilt database for {player} ({sum(rows.values())} new rows)")
+  return rows
+
+def tracked_players(PATH) -> list:
+  return [player.strip() for player in open(PATH + "/data/trackedplayers.txt").readlines() if player.strip()]
+
+async def rebuild_dbs(PATH, progress=None, full=False, players=None):
+  """
+  Updates the stat tables of the given players, or every tracked player, up to rebuild_workers at
+  a time, from scratch if full is set. progress is called as progress(player, done, total, error)
+  as each player finishes, error being None on success.
+  """
+  logging.info("Rebuilding databeses.")
+  if players is None:
+    players = tracked_players(PATH)
+
+  async def rebuild(player):
+    try:
+      await rebuild_db(player, full)
+      return player, None
+    except Exception as e:
+      logging.error(f"Failed to rebuild database for {player}: {e}")
+      return player, e
+
+  done = 0
+  for finished in asyncio.as_completed([rebuild(player) for player in players]):
+    player, error = await finished
+    done += 1
+    logging.info(f"Rebuilt {done}/{len(players)} databases")
+    if progress is not None:
+      progress(player, done, len(players), error)
 
 def time_until_next_run(target_hour=0, target_minute=0):
   now = datetime.datetime.now()
@@ -195,49 +471,103 @@ def time_until_next_run(target_hour=0, target_minute=0):
 
 async def daily_scheduler():
   while True:
-    seconds_until_next_run = time_until_next_run(target_hour=6, target_minute=0)  # Adjust time as needed
+    seconds_until_next_run = time_until_next_run(target_hour=CONFIG.REBUILD_HOUR, target_minute=0)
     await asyncio.sleep(seconds_until_next_run)  
-    await initialize_dbs() 
+    try:
+      await warm_start(CONFIG.PATH)
+    except Exception as e:
+      logging.error(f"Daily rebuild failed: {e}")
+    logging.info(f"Frame cache: {cache_stats()}")
+
+def start_scheduler() -> asyncio.Task:
+  """Starts daily_scheduler in the background unless it is already running, and returns its task."""
+  global _scheduler
+
+  if _scheduler is None or _scheduler.done():
+    _scheduler = asyncio.create_task(daily_scheduler())
+  return _scheduler
+
+def stop_scheduler():
+  global _scheduler
+  if _scheduler is not None:
+    _scheduler.cancel()
+    _scheduler = None
+
+def state_path(directory):
+  return os.path.join(directory, "data", "databases", "state.json")
+
+def _registry_version():
+  # Changes whenever a table's columns do, so a state image from before is ignored
+  return hashlib.sha1(json.dumps({mode: table_columns(mode) for mode in MODES}).encode()).hexdigest()
+
+def load_state(directory) -> dict:
+  """
+  Returns the state image: the last tracked day each player's tables were brought up to date
+  with. Empty if there is none, it can't be read or it was written for other table columns.
+  """
+  try:
+    with open(state_path(directory), "r") as f:
+      state = json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+  return state.get("players", {}) if state.get("version") == _registry_version() else {}
+
+def save_state(directory, players):
+  path = state_path(directory)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+
+  # The updater and the bot can both save it
+  tmp_path = store.temp_path(path)
+  try:
+    with open(tmp_path, "w") as f:
+      json.dump({"version": _registry_version(), "players": players}, f)
+    os.replace(tmp_path, path)
+  except BaseException:
+    os.remove(tmp_path)
+    raise
+
+def is_loading(uuid) -> bool:
+  """Returns whether the warm start is still bringing a player's tables up to date."""
+  return _status.get(uuid) == LOADING
 
 async def initialize_dbs(directory):
-  PATH = f"{directory}/data/"
-  players = [player.strip() for player in open(PATH + "trackedplayers.txt").readlines()]
-
-  now = datetime.datetime.now().strftime('%d-%m-%y')
-
-  for player in players:
-    databases[player] = {}
-
-    player_dir = PATH + f"/databases/{player}"
-
-    if not os.path.exists(player_dir):
-      os.mkdir(player_dir)
-
-    datatypes = {
-       'bedwars': 'bedwars.h5',
-       'bridge':  'bridge.h5'
-    }
-    for datatype, datapath in datatypes.items():
-      datapath = f"{player_dir}/{datapath}"
-      if not os.path.isfile(datapath):
-        asyncio.create_task(rebuild_db(player))
-        break
-
-      df = pd.read_hdf(datapath)
-
-      if df["Date"].iloc[-1] != now:
-        json_path = f"{player_dir}/{now}.json"
-
-        if os.path.isfile(json_path):
-          with open(json_path, "r") as file:
-            json_data = json.load(file)
-            json_data["date"] = json_path.removesuffix(".json")
-
-            if json_data.get("success") is True:
-              dat = dat.normalizeJSON(datatype, json_data)
-              df = pd.concat([df, dat], ignore_index=True)
-
-              df.to_hdf(datapath)
-
-      databases[player][datatype] = df
-    logging.info(f"Loaded database for {player}")
\ No newline at end of file
+  """
+  Brings every tracked player's tables up to date. Players whose tables already cover their last
+  tracked day, according to the state image and one catalog query, are ready at once. The rest
+  are rebuilt in the process pool in parallel, each becoming ready as it finishes, while the bot
+  keeps serving commands for everyone else.
+  """
+  # Tables are memory mapped when a command needs them, so nothing is loaded here
+  state = load_state(directory)
+  last = catalog.last_days(directory)
+  players = tracked_players(directory)
+
+  stale = [player for player in players if player not in last or state.get(player) != last[player]]
+  _status.clear()
+  _status.update({player: LOADING for player in stale})
+  logging.info(f"{len(players) - len(stale)} of {len(players)} players ready, updating {len(stale)}.")
+
+  def progress(player, done, total, error):
+    if error is not None:
+      _status[player] = FAILED
+      return
+
+    _status.pop(player, None)
+    # The day read before the rebuild started, so a day tracked during it is picked up next time
+    if player in last:
+      state[player] = last[player]
+
+  try:
+    await rebuild_dbs(directory, progress, players=stale)
+  finally:
+    save_state(directory, {player: state[player] for player in players if player in state})
+  logging.info("Loaded databases")
+
+def warm_start(directory) -> asyncio.Task:
+  """Starts initialize_dbs in the background unless it is already running, and returns its task."""
+  global _warm
+
+  if _warm is None or _warm.done():
+    _warm = asyncio.create_task(initialize_dbs(directory))
+  return _warm
@@ -0,0 +1,48 @@
+"""
+Rewrites the stored snapshots of every tracked player in the storage format and compression set
+in config.toml, or the ones given on the command line. Run it once after changing
+`snapshot_storage` or `compress_snapshots`. With --project, old snapshots are also cut down to
+`snapshot_projection`, which permanently drops everything outside it. Compressed and plain files can be read side by side,
+so the bot can keep running while this happens.
+
+  python tracking/migrate.py [--storage delta|full] [--compress | --no-compress] [--train-dictionary] [--project]
+"""
+import argparse
+import sys
+
+from bootstrap import ROOT, load_package
+
+load_package()
+
+from sprocket_hypixel import hypixel
+from sprocket_hypixel.config import CONFIG
+from sprocket_hypixel.tracking import snapshots
+
+
+def main():
+  args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  args.add_argument("--storage", choices=["full", "delta"], default=None)
+  args.add_argument("--compress", action=argparse.BooleanOptionalAction, default=None)
+  args.add_argument("--project", action="store_true", help="Cut old snapshots down to snapshot_projection.")
+  args.add_argument("--train-dictionary", action="store_true", help="Train a new compression dictionary on the existing snapshots first.")
+  args = args.parse_args()
+
+  PATH = str(ROOT)
+  if not hypixel.initialize_config(PATH):
+    sys.exit(1)
+
+  storage = args.storage or CONFIG.SNAPSHOT_STORAGE
+
+  with open(PATH + "/data/trackedplayers.txt", "r") as f:
+    players = [player.strip() for player in f.readlines() if player.strip()]
+
+  if args.train_dictionary:
+    dict_id = snapshots.train_dictionary(PATH, players)
+    print(f"Trained snapshot dictionary {dict_id}.")
+
+  for player in players:
+    count = snapshots.rewrite_history(PATH, player, storage=storage, compress=args.compress, projection=CONFIG.SNAPSHOT_PROJECTION if args.project else ())
+    print(f"Rewrote {count} snapshots for {player} as {storage}.")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,42 @@
+"""
+Brings the stat tables of every tracked player up to date with their snapshots. Only snapshots
+taken since a table was last updated are parsed, unless --full is given, which rebuilds every
+table from scratch. Run it with --full after changing the stats a table holds. The bot does the
+incremental update itself when it starts.
+
+  python tracking/rebuild.py [--full]
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from bootstrap import ROOT, load_package
+
+load_package()
+
+from sprocket_hypixel import hypixel
+from sprocket_hypixel.tracking import databases
+
+
+def main():
+  args = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  args.add_argument("--full", action="store_true", help="Rebuild every table from all of its snapshots.")
+  args = args.parse_args()
+
+  PATH = str(ROOT)
+  if not hypixel.initialize_config(PATH):
+    sys.exit(1)
+
+  def progress(player, done, total, error):
+    print(f"[{done}/{total}] {player}: {'failed, ' + str(error) if error else 'done'}")
+
+  start = time.perf_counter()
+  try:
+    asyncio.run(databases.rebuild_dbs(PATH, progress=progress, full=args.full))
+  finally:
+    databases.shutdown_pool()
+  print(f"Finished in {time.perf_counter() - start:.1f}s.")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,442 @@
+import os, json, datetime, logging, shutil
+
+from ..config import CONFIG
+from . import catalog
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+"""Reading and writing of the daily player snapshots in data/trackedplayers/<uuid>/.
+Snapshot files are named after the day they were taken (dd-mm-yy). When a player's
+document has not changed since the previous day, no file is written and mapping.json
+points the day at the earlier snapshot instead.
+
+With SNAPSHOT_STORAGE = "delta", only every KEYFRAME_INTERVAL-th snapshot is stored in
+full as <date>.json. The days in between are stored as <date>.delta.json, holding only
+the keys that changed since the snapshot they are based on:
+
+  {"base": "<dd-mm-yy>", "depth": 3, "set": [[path, value], ...], "unset": [path, ...]}
+
+where a path is the list of keys leading to the value and depth counts the deltas
+between this one and its keyframe.
+
+With COMPRESS_SNAPSHOTS, new files are zstd compressed and get a .zst suffix. They are
+compressed with the dictionary trained by train_dictionary if there is one. Dictionaries
+are kept in data/snapshot_dictionaries/<dictionary id>.dict and are never deleted,
+because every compressed file records the id of the dictionary it needs.
+
+Before a document is stored it is cut down to the paths in SNAPSHOT_PROJECTION, the
+only parts of it the stats code reads. If RAW_RETENTION_DAYS is set, the complete
+document is also kept in raw/<date>.json for that many days.
+
+Which file holds each day is recorded in the SQLite catalog (see catalog.py), so reads
+look a date up with one indexed query instead of probing the directory and mapping.json.
+mapping.json is still written so the catalog can be rebuilt from the files."""
+
+DATE_FORMAT = "%d-%m-%y"
+
+FULL_SUFFIX       = ".json"
+DELTA_SUFFIX      = ".delta.json"
+COMPRESSED_SUFFIX = ".zst"
+
+# (suffix, is_delta), longest suffixes first so they are matched before their plain versions
+SUFFIXES = [
+  (DELTA_SUFFIX + COMPRESSED_SUFFIX, True),
+  (FULL_SUFFIX + COMPRESSED_SUFFIX, False),
+  (DELTA_SUFFIX, True),
+  (FULL_SUFFIX, False)
+]
+
+COMPRESSION_LEVEL = 10
+DICTIONARY_SIZE   = 112640
+
+"""Loaded dictionaries, keyed by (dictionary directory, dictionary id)."""
+_dictionaries = {}
+
+
+def player_dir(directory, uuid):
+  return os.path.join(directory, "data", "trackedplayers", uuid)
+
+def _parse_date(date_str):
+  return datetime.datetime.strptime(date_str, DATE_FORMAT)
+
+def _dictionary_dir(wkdir):
+  # wkdir is data/trackedplayers/<uuid>
+  return os.path.join(os.path.dirname(os.path.dirname(wkdir)), "snapshot_dictionaries")
+
+def _dictionary(dictionary_dir, dict_id=None):
+  """Returns the dictionary with the given id, or the current one if dict_id is None. None if there is no such dictionary."""
+  if dict_id is None:
+    try:
+      with open(os.path.join(dictionary_dir, "current"), "r") as f:
+        dict_id = int(f.read().strip())
+    except (OSError, ValueError):
+      return None
+
+  key = (dictionary_dir, dict_id)
+  if key not in _dictionaries:
+    with open(os.path.join(dictionary_dir, f"{dict_id}.dict"), "rb") as f:
+      _dictionaries[key] = zstandard.ZstdCompressionDict(f.read())
+  return _dictionaries[key]
+
+def _load(path):
+  if not path.endswith(COMPRESSED_SUFFIX):
+    with open(path, "r") as f:
+      return json.load(f)
+
+  if zstandard is None:
+    raise ImportError(f"{path} is compressed. Install the zstandard package to read it.")
+
+  with open(path, "rb") as f:
+    compressed = f.read()
+
+  dict_id = zstandard.get_frame_parameters(compressed).dict_id
+  dictionary = _dictionary(_dictionary_dir(os.path.dirname(path)), dict_id) if dict_id else None
+  decompressor = zstandard.ZstdDecompressor(dict_data=dictionary) if dictionary is not None else zstandard.ZstdDecompressor()
+
+  return json.loads(decompressor.decompress(compressed))
+
+def _dump(path, data):
+  encoded = json.dumps(data, separators=(",", ":")).encode()
+
+  if path.endswith(COMPRESSED_SUFFIX):
+    dictionary = _dictionary(_dictionary_dir(os.path.dirname(path)))
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dictionary) if dictionary is not None else zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+    encoded = compressor.compress(encoded)
+
+  with open(path, "wb") as f:
+    f.write(encoded)
+
+def _should_compress(compress):
+  if compress is None:
+    compress = CONFIG.COMPRESS_SNAPSHOTS
+
+  if compress and zstandard is None:
+    logging.warning("compress_snapshots is enabled but zstandard is not installed. Writing uncompressed snapshots.")
+    return False
+  return compress
+
+def _load_mapping(wkdir):
+  mapping_filepath = os.path.join(wkdir, "mapping.json")
+  if not os.path.exists(mapping_filepath):
+    return {}
+  return _load(mapping_filepath)
+
+def _locate(wkdir, date_str):
+  """Returns (path, is_delta) for the file stored under date_str, or None if that date has no file of its own."""
+  for suffix, is_delta in SUFFIXES:
+    path = os.path.join(wkdir, date_str + suffix)
+    if os.path.exists(path):
+      return path, is_delta
+
+  return None
+
+def _is_delta(filename):
+  for suffix, is_delta in SUFFIXES:
+    if filename.endswith(suffix):
+      return is_delta
+  return False
+
+def list_dates(wkdir) -> list:
+  """Returns the dates (dd-mm-yy) that have a stored snapshot file, oldest first."""
+  dates = set()
+  for filename in os.listdir(wkdir):
+    if filename == "mapping.json":
+      continue
+
+    for suffix, _ in SUFFIXES:
+      if filename.endswith(suffix):
+        dates.add(filename.removesuffix(suffix))
+        break
+
+  return sorted(dates, key=_parse_date)
+
+
+def project(doc: dict, paths) -> dict:
+  """Returns a document containing only the given dotted paths of doc. An empty projection keeps everything."""
+  if not paths:
+    return doc
+
+  projected = {}
+  for path in paths:
+    keys = path.split(".")
+
+    node = doc
+    for key in keys:
+      if not isinstance(node, dict) or key not in node:
+        break
+      node = node[key]
+    else:
+      target = projected
+      for key in keys[:-1]:
+        target = target.setdefault(key, {})
+      target[keys[-1]] = node
+
+  return projected
+
+def _write_raw(wkdir, date, data, retention_days, compress):
+  raw_dir = os.path.join(wkdir, "raw")
+  os.makedirs(raw_dir, exist_ok=True)
+
+  date_str = date.strftime(DATE_FORMAT)
+  _store(raw_dir, date_str, data, is_delta=False, compress=compress)
+
+  cutoff = date - datetime.timedelta(days=retention_days)
+  for old_date in list_dates(raw_dir):
+    if _parse_date(old_date) <= cutoff:
+      os.remove(_locate(raw_dir, old_date)[0])
+
+def read_raw(directory, uuid, date_str):
+  """Returns the unprojected document for a date if it is still within RAW_RETENTION_DAYS, otherwise None."""
+  raw_dir = os.path.join(player_dir(directory, uuid), "raw")
+  located = _locate(raw_dir, date_str) if os.path.isdir(raw_dir) else None
+  return _load(located[0]) if located is not None else None
+
+
+def diff(old: dict, new: dict) -> dict:
+  """Returns the structural delta that turns old into new. Lists are compared as whole values."""
+  changes, removed = [], []
+  _diff(old, new, [], changes, removed)
+  return {"set": changes, "unset": removed}
+
+def _diff(old, new, path, changes, removed):
+  for key, value in new.items():
+    if key not in old:
+      changes.append([path + [key], value])
+      continue
+
+    previous = old[key]
+    if isinstance(value, dict) and isinstance(previous, dict):
+      _diff(previous, value, path + [key], changes, removed)
+    elif type(value) is not type(previous) or value != previous:
+      changes.append([path + [key], value])
+
+  for key in old:
+    if key not in new:
+      removed.append(path + [key])
+
+def apply_delta(doc: dict, delta: dict) -> dict:
+  """
+  Returns a new document with the delta applied. Only the dicts along changed paths are
+  copied, so the result shares every unchanged subtree with doc and doc is left untouched.
+  """
+  doc = dict(doc)
+  copied = {id(doc)}
+
+  def parent(path):
+    node = doc
+    for key in path[:-1]:
+      child = node.get(key)
+      if not isinstance(child, dict):
+        child = {}
+      elif id(child) not in copied:
+        child = dict(child)
+      copied.add(id(child))
+      node[key] = child
+      node = child
+    return node
+
+  for path, value in delta["set"]:
+    parent(path)[path[-1]] = value
+  for path in delta["unset"]:
+    parent(path).pop(path[-1], None)
+
+  return doc
+
+
+def _read_stored(wkdir, date_str, filename=None):
+  """Returns (document, depth) for a date that has its own file, named filename if the catalog gave it."""
+  path = os.path.join(wkdir, filename) if filename is not None else None
+  if path is not None and os.path.exists(path):
+    is_delta = _is_delta(filename)
+  else:
+    located = _locate(wkdir, date_str)
+    if located is None:
+      raise FileNotFoundError(f"Snapshot {date_str} in {wkdir} is missing.")
+    path, is_delta = located
+
+  if not is_delta:
+    return _load(path), 0
+
+  delta = _load(path)
+  base, _ = _read_stored(wkdir, delta["base"])
+  return apply_delta(base, delta), delta["depth"]
+
+def read_snapshot(directory, uuid, date_str, nearest=False):
+  """
+  Returns the player's document for a date, rebuilding it from its keyframe if needed. None if
+  there is no snapshot. With nearest=True, returns the closest earlier snapshot instead.
+  """
+  wkdir = player_dir(directory, uuid)
+  if not os.path.isdir(wkdir):
+    return None
+
+  found = catalog.lookup(directory, uuid, date_str, nearest)
+  if found is None:
+    return None
+
+  stored, filename = found
+  return _read_stored(wkdir, stored, filename)[0]
+
+def iter_snapshots(directory, uuid, after=None):
+  """
+  Yields (date, document) for every stored snapshot, oldest first, or only those after the date
+  `after`. Deltas are applied to the document yielded before them, so each file is read once. The
+  top level of each document is a fresh dict and may be modified, nested values are shared and
+  must not be.
+  """
+  wkdir = player_dir(directory, uuid)
+  previous_date, previous = None, None
+
+  for date_str, filename in catalog.stored_files(directory, uuid, after):
+    path, is_delta = os.path.join(wkdir, filename), _is_delta(filename)
+    if not is_delta:
+      doc = _load(path)
+    else:
+      delta = _load(path)
+      base = previous if delta["base"] == previous_date else _read_stored(wkdir, delta["base"])[0]
+      doc = apply_delta(base, delta)
+
+    previous_date, previous = date_str, doc
+    yield date_str, dict(doc)
+
+
+def write_snapshot(directory, uuid, date: datetime.datetime, data: dict, storage=None, keyframe_interval=None, compress=None, projection=None, raw_retention_days=None) -> bool:
+  """Stores a player's document for a date. Returns False if it matched the previous day and only the mapping was updated."""
+  storage            = storage or CONFIG.SNAPSHOT_STORAGE
+  keyframe_interval  = keyframe_interval or CONFIG.KEYFRAME_INTERVAL
+  compress           = _should_compress(compress)
+  projection         = CONFIG.SNAPSHOT_PROJECTION if projection is None else projection
+  raw_retention_days = CONFIG.RAW_RETENTION_DAYS if raw_retention_days is None else raw_retention_days
+
+  wkdir = player_dir(directory, uuid)
+  os.makedirs(wkdir, exist_ok=True)
+
+  if raw_retention_days > 0:
+    _write_raw(wkdir, date, data, raw_retention_days, compress)
+  data = project(data, projection)
+
+  date_str      = date.strftime(DATE_FORMAT)
+  yesterday_str = (date - datetime.timedelta(days=1)).strftime(DATE_FORMAT)
+
+  # Yesterday may itself have been mapped to an earlier snapshot
+  found = catalog.lookup(directory, uuid, yesterday_str)
+  previous, previous_file = found if found is not None else (None, None)
+  previous_doc, previous_depth = _read_stored(wkdir, previous, previous_file) if previous is not None else (None, 0)
+
+  if previous_doc is not None and previous_doc == data:
+    mapping = _load_mapping(wkdir)
+    mapping[date_str] = previous
+
+    with open(os.path.join(wkdir, "mapping.json"), "w") as f:
+      json.dump(mapping, f, indent=2)
+    catalog.record(directory, uuid, date_str, previous, previous_file)
+    return False
+
+  if storage == "delta" and previous_doc is not None and previous_depth + 1 < keyframe_interval:
+    delta = diff(previous_doc, data)
+    delta["base"]  = previous
+    delta["depth"] = previous_depth + 1
+    filename = _store(wkdir, date_str, delta, is_delta=True, compress=compress)
+  else:
+    filename = _store(wkdir, date_str, data, is_delta=False, compress=compress)
+
+  catalog.record(directory, uuid, date_str, date_str, filename)
+  return True
+
+def rewrite_history(directory, uuid, storage=None, keyframe_interval=None, compress=None, projection=()):
+  """
+  Rewrites every stored snapshot of a player in the given storage format, cutting them down to
+  projection if one is given. Returns the number of snapshots rewritten.
+  """
+  storage           = storage or CONFIG.SNAPSHOT_STORAGE
+  keyframe_interval = keyframe_interval or CONFIG.KEYFRAME_INTERVAL
+  compress          = _should_compress(compress)
+
+  wkdir = player_dir(directory, uuid)
+  new_wkdir = wkdir + ".rewrite"
+  old_wkdir = wkdir + ".old"
+  os.makedirs(new_wkdir, exist_ok=True)
+
+  count = 0
+  previous_date, previous, depth = None, None, 0
+  for date_str, doc in iter_snapshots(directory, uuid):
+    doc = project(doc, projection)
+
+    if storage == "delta" and previous is not None and depth + 1 < keyframe_interval:
+      delta = diff(previous, doc)
+      delta["base"]  = previous_date
+      delta["depth"] = depth = depth + 1
+      _store(new_wkdir, date_str, delta, is_delta=True, compress=compress)
+    else:
+      depth = 0
+      _store(new_wkdir, date_str, doc, is_delta=False, compress=compress)
+
+    previous_date, previous = date_str, doc
+    count += 1
+
+  mapping_filepath = os.path.join(wkdir, "mapping.json")
+  if os.path.exists(mapping_filepath):
+    shutil.copyfile(mapping_filepath, os.path.join(new_wkdir, "mapping.json"))
+
+  raw_dir = os.path.join(wkdir, "raw")
+  if os.path.isdir(raw_dir):
+    shutil.copytree(raw_dir, os.path.join(new_wkdir, "raw"))
+
+  # Swap the directories so a crash part way through never leaves a half written history
+  os.rename(wkdir, old_wkdir)
+  os.rename(new_wkdir, wkdir)
+  shutil.rmtree(old_wkdir)
+
+  # File names change with the format, so the player's rows are rebuilt from the new files
+  catalog.index_player(directory, uuid)
+  return count
+
+def _store(wkdir, date_str, data, is_delta, compress=False):
+  suffix = (DELTA_SUFFIX if is_delta else FULL_SUFFIX) + (COMPRESSED_SUFFIX if compress else "")
+
+  # Rerunning the updater on the same day may switch between formats
+  for other, _ in SUFFIXES:
+    stale = os.path.join(wkdir, date_str + other)
+    if other != suffix and os.path.exists(stale):
+      os.remove(stale)
+
+  _dump(os.path.join(wkdir, date_str + suffix), data)
+  return date_str + suffix
+
+def train_dictionary(directory, players, max_samples=2000) -> int:
+  """
+  Trains a zstd dictionary on the stored snapshots of the given players and makes it the
+  current one for new compressed files. Returns the dictionary id.
+  """
+  if zstandard is None:
+    raise ImportError("Install the zstandard package to train a snapshot dictionary.")
+
+  samples = []
+  for uuid in players:
+    wkdir = player_dir(directory, uuid)
+    if not os.path.isdir(wkdir):
+      continue
+
+    # Sample the files as they are stored so deltas and keyframes are both represented
+    for date_str in list_dates(wkdir):
+      path, _ = _locate(wkdir, date_str)
+      samples.append(json.dumps(_load(path), separators=(",", ":")).encode())
+      if len(samples) >= max_samples:
+        break
+    if len(samples) >= max_samples:
+      break
+
+  dictionary = zstandard.train_dictionary(DICTIONARY_SIZE, samples)
+  dict_id = dictionary.dict_id()
+
+  dictionary_dir = os.path.join(directory, "data", "snapshot_dictionaries")
+  os.makedirs(dictionary_dir, exist_ok=True)
+  with open(os.path.join(dictionary_dir, f"{dict_id}.dict"), "wb") as f:
+    f.write(dictionary.as_bytes())
+  with open(os.path.join(dictionary_dir, "current"), "w") as f:
+    f.write(str(dict_id))
+
+  return dict_id
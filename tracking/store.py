@@ -0,0 +1,172 @@
+import os, bisect, datetime, threading
+
+"""Columnar storage for the per-player stat tables built from snapshots.
+
+Each player has a directory data/databases/<uuid>/ with one Arrow IPC (Feather v2) file
+per mode, e.g. bedwars.arrow. Files are written uncompressed so they can be memory
+mapped, and reading a subset of columns only touches the pages of those columns.
+pyarrow is imported on first use to keep startup cheap.
+
+Each file records the date of the last snapshot it was built from (its high-water mark)
+in the schema metadata, so a rebuild only has to parse the snapshots after it. The mark
+is written together with the rows it covers, so the two can never disagree."""
+
+SUFFIX = ".arrow"
+MARK_KEY = b"last_snapshot"
+DATE_FORMAT = "%d-%m-%y"
+
+
+class _Dates():
+  """The Date column of a frame as a sequence of datetimes, parsing only the entries bisect looks at."""
+  def __init__(self, column):
+    self.column = column
+
+  def __len__(self):
+    return len(self.column)
+
+  def __getitem__(self, index):
+    return datetime.datetime.strptime(self.column[index].as_py(), DATE_FORMAT)
+
+
+def temp_path(path):
+  """
+  Returns a name next to path, unique to this process and thread, to write a file to before moving
+  it over path. Processes rebuilding the same player at once never write to the same one.
+  """
+  return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+def frame_path(directory, uuid, mode):
+  return os.path.join(directory, "data", "databases", uuid, mode + SUFFIX)
+
+def has_frame(directory, uuid, mode) -> bool:
+  return os.path.isfile(frame_path(directory, uuid, mode))
+
+def frame_version(directory, uuid, mode):
+  """Returns a value that changes whenever a player's frame is rewritten. None if it does not exist."""
+  # Every write replaces the file, so the inode changes even when the mtime does not
+  try:
+    st = os.stat(frame_path(directory, uuid, mode))
+    return st.st_ino, st.st_size, st.st_mtime_ns
+  except FileNotFoundError:
+    return None
+
+def write_frame(directory, uuid, mode, df, mark=None):
+  """Writes a frame for a player and mode, replacing the old file atomically. mark is the date of the last snapshot in it."""
+  import pyarrow as pa
+  from pyarrow import feather
+
+  path = frame_path(directory, uuid, mode)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+
+  table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+  if mark is not None:
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), MARK_KEY: mark.encode()})
+
+  tmp_path = temp_path(path)
+  try:
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+  except BaseException:
+    os.remove(tmp_path)
+    raise
+
+def append_frame(directory, uuid, mode, df, mark, fill=None):
+  """
+  Appends rows to a player's frame and moves its mark forward, rewriting the file atomically.
+  fill is applied to the combined frame, e.g. to fill columns only some of the rows have.
+  """
+  import pandas as pd
+
+  existing = read_frame(directory, uuid, mode)
+  if existing is not None and len(df) == 0:
+    df = existing
+  elif existing is not None and len(existing):
+    df = pd.concat([existing, df], ignore_index=True)
+  write_frame(directory, uuid, mode, fill(df) if fill is not None else df, mark)
+
+def find_before(directory, uuid, mode, date: datetime.datetime):
+  """
+  Returns the index of the last row dated on or before date in a player's frame. None if there is
+  no such row or frame. Rows are stored in date order, so this is a binary search that parses
+  O(log n) dates of the memory mapped Date column.
+  """
+  from pyarrow import feather
+
+  path = frame_path(directory, uuid, mode)
+  if not os.path.isfile(path):
+    return None
+
+  dates = _Dates(feather.read_table(path, columns=["Date"], memory_map=True)["Date"])
+  index = bisect.bisect_right(dates, date) - 1
+  return index if index >= 0 else None
+
+def find_row(directory, uuid, mode, date_str):
+  """Returns the index of the row for a date in a player's frame. None if there is no such row or frame."""
+  date = datetime.datetime.strptime(date_str, DATE_FORMAT)
+  index = find_before(directory, uuid, mode, date)
+
+  if index is None or read_row(directory, uuid, mode, index, ["Date"])["Date"] != date_str:
+    return None
+  return index
+
+def read_row(directory, uuid, mode, index, columns=None) -> dict:
+  """Returns one row of a player's frame as a dict, limited to columns if given."""
+  from pyarrow import feather
+
+  table = feather.read_table(frame_path(directory, uuid, mode), memory_map=True)
+  if columns is not None:
+    table = table.select([column for column in dict.fromkeys(columns) if column in table.column_names])
+
+  # Only the pages holding this row are touched
+  return table.slice(index, 1).to_pylist()[0]
+
+def read_mark(directory, uuid, mode, columns=None):
+  """
+  Returns the date of the last snapshot in a player's frame. None if there is no frame, it
+  predates marks, or its columns are not the given ones.
+  """
+  import pyarrow as pa
+
+  path = frame_path(directory, uuid, mode)
+  if not os.path.isfile(path):
+    return None
+
+  # Only the footer is read to get the schema
+  with pa.memory_map(path) as source:
+    schema = pa.ipc.open_file(source).schema
+
+  if columns is not None and schema.names != list(columns):
+    return None
+  mark = (schema.metadata or {}).get(MARK_KEY)
+  return mark.decode() if mark is not None else None
+
+def date_span(directory, uuid, mode):
+  """Returns the dates of the first and last rows of a player's frame. None if it has no rows or does not exist."""
+  from pyarrow import feather
+
+  path = frame_path(directory, uuid, mode)
+  if not os.path.isfile(path):
+    return None
+
+  dates = _Dates(feather.read_table(path, columns=["Date"], memory_map=True)["Date"])
+  if len(dates) == 0:
+    return None
+  return dates[0], dates[len(dates) - 1]
+
+def read_frame(directory, uuid, mode, columns=None, start=0):
+  """
+  Returns the stored frame for a player and mode, limited to columns and to the rows from index
+  start on if given. None if it does not exist.
+  """
+  from pyarrow import feather
+
+  path = frame_path(directory, uuid, mode)
+  if not os.path.isfile(path):
+    return None
+
+  # Memory mapped, so nothing is read until columns are converted below
+  table = feather.read_table(path, memory_map=True)
+  if columns is not None:
+    table = table.select([column for column in dict.fromkeys(columns) if column in table.column_names])
+
+  return table.slice(start).to_pandas()
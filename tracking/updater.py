@@ -1,66 +1,103 @@
-import os
-import requests
-from datetime import datetime, timedelta
-import json
+import asyncio
 import sys
-import toml
+import time
+from datetime import datetime
 
-from pathlib import Path
+from bootstrap import ROOT, load_package
 
-def get_key(path):
-  with open(path + "/config.toml", "r") as f:
-    data = toml.load(f)
-    return data["api_key"].strip()
-  
+load_package()
+
+from sprocket_hypixel import api, hypixel
+from sprocket_hypixel.config import CONFIG
+from sprocket_hypixel.tracking import catalog, databases, snapshots
+
+# Failed requests other than 429s (which the scheduler retries) are tried this many more times
+RETRIES = 2
+
+
+class Summary():
+  def __init__(self):
+    self.written   = 0
+    self.unchanged = 0
+    self.failed    = 0
+    self.retries   = 0
+
+
+async def update_player(player, date, summary: Summary):
+  for attempt in range(RETRIES + 1):
+    try:
+      data = await api.fetch_player(player, fresh=True, priority=api.BACKGROUND)
+      break
+    except api.APIError as e:
+      if e.status == 403 or attempt == RETRIES:
+        print(f"Failed to get data for {player}: {e}")
+        summary.failed += 1
+        return
+    except Exception as e:
+      if attempt == RETRIES:
+        print(f"Failed to get data for {player}: {e}")
+        summary.failed += 1
+        return
+
+    summary.retries += 1
+    await asyncio.sleep(2 ** attempt)
+
+  # File writes happen off the event loop so they don't hold up the other requests
+  if await asyncio.to_thread(snapshots.write_snapshot, CONFIG.PATH, player, date, data):
+    summary.written += 1
+    print(f"Wrote data for {player}")
+  else:
+    summary.unchanged += 1
+    print(f"Data for {player} is the same as yesterday. Ignoring.")
+
+async def update(players, date, concurrency):
+  summary = Summary()
+  semaphore = asyncio.Semaphore(concurrency)
+
+  async def bounded(player):
+    async with semaphore:
+      await update_player(player, date, summary)
+
+  try:
+    await asyncio.gather(*[bounded(player) for player in players])
+  finally:
+    await api.close()
+
+  summary.retries += api.scheduler().retries
+  return summary
 
 def main():
-  # Have to go up one directory becuase this is in tracking, not root
-  PATH = str(Path(__file__).parents[1].absolute())
-  key = get_key(PATH)
+  PATH = str(ROOT)
+  if not hypixel.initialize_config(PATH):
+    sys.exit(1)
 
-  players = None
   with open(PATH + "/data/trackedplayers.txt", "r") as f:
-    players = [player.strip() for player in f.readlines()]
+    players = [player.strip() for player in f.readlines() if player.strip()]
+
+  # Every snapshot in a run gets the date the run started, even if it crosses midnight
+  DATE = datetime.now()
 
-  PATH = PATH + "/data/"
-  DATE = datetime.now().strftime("%d-%m-%y")
-  YESTERDAY_DATE = (datetime.now() - timedelta(days=1)).strftime("%d-%m-%y")
-  
+  start = time.perf_counter()
+  summary = asyncio.run(update(players, DATE, CONFIG.UPDATER_CONCURRENCY))
+  elapsed = time.perf_counter() - start
+
+  print(f"Updated {len(players)} players in {elapsed:.1f}s ({len(players) / elapsed if elapsed else 0:.2f} players/s). "
+        f"{summary.written} written, {summary.unchanged} unchanged, {summary.failed} failed, {summary.retries} retries.")
+
+  # Days missed by earlier runs can't be recovered, but are worth knowing about
   for player in players:
-    url = f'https://api.hypixel.net/player?key={key}&uuid=' + player
-    data = requests.get(url).json()
-
-    FILEPATH = f"{PATH}/trackedplayers/{player}/{DATE}.json"
-    YESTERDAY_FILEPATH = f"{PATH}/trackedplayers/{player}/{YESTERDAY_DATE}.json"
-    MAPPING_FILEPATH = f"{PATH}/trackedplayers/{player}/mapping.json"
-    
-    if os.path.exists(YESTERDAY_FILEPATH):
-      with open(YESTERDAY_FILEPATH, "r") as f:
-        if json.load(f) == data:
-          print(f"Data for {player} is the same as yesterday. Ignoring.")
-        
-          if os.path.exists(MAPPING_FILEPATH):
-            with open(MAPPING_FILEPATH, "r") as map_file:
-              mapping = json.load(map_file)
-              mapping[DATE] = mapping[YESTERDAY_DATE] if YESTERDAY_DATE in mapping else YESTERDAY_DATE
-          else:
-            mapping = {}
-            mapping[DATE] = YESTERDAY_DATE
-          
-          with open(MAPPING_FILEPATH, "w") as f:
-            json.dump(mapping, f, indent=2)
-          
-          continue
-
-    if(os.path.exists(PATH + "trackedplayers/" + player)):
-      with open(FILEPATH, 'w') as f:
-        f.write(json.dumps(data))
-      print("Wrote data for " + player)
-      continue
-
-    with open(FILEPATH, "w") as f:
-      f.write(json.dumps(data))
-    print(f"Wrote data for {player} at {FILEPATH}.")
-    continue
-
-main()
\ No newline at end of file
+    missing = catalog.gaps(PATH, player)
+    if missing:
+      print(f"{player} has no snapshots for {len(missing)} days: {', '.join(missing)}")
+
+  # Bring the stat tables up to date with the new snapshots now, so a running bot serves them,
+  # and invalidates its cached frames and graphs, without waiting for its own daily rebuild
+  start = time.perf_counter()
+  try:
+    asyncio.run(databases.initialize_dbs(PATH))
+  finally:
+    databases.shutdown_pool()
+  print(f"Updated the stat tables in {time.perf_counter() - start:.1f}s.")
+
+if __name__ == "__main__":
+  main()
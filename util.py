@@ -1,4 +1,4 @@
-import discord, datetime, calendar, requests, logging
+import discord, logging, asyncio, datetime, re
 
 from discord.ext import commands, bridge
 
@@ -7,6 +7,7 @@ from functools import wraps
 from functools import wraps
 
 from .tracking import databases
+from . import api
 
 from .config import CONFIG, both_in, guild_in
 
@@ -36,6 +37,19 @@ def tracking_required(func):
     return await func(self, ctx, *args, **kwargs)
   
   return wrapped
+
+async def fail_key_required(self, ctx, *args, **kwargs):
+  await ctx.respond("The Hypixel API key was rejected, so live stats are unavailable. Tracked stats still work.")
+  return
+
+def key_required(func):
+  @wraps(func)
+  async def wrapped(self, ctx, *args, **kwargs):
+    if CONFIG.KEY_VALID is False:
+      return await fail_key_required(self, ctx, *args, **kwargs)
+    return await func(self, ctx, *args, **kwargs)
+
+  return wrapped
       
 
 directory = None
@@ -45,14 +59,28 @@ class Util(commands.Cog):
     global directory
     directory = dir
 
+    api.load_uuid_cache(dir)
+
   @commands.Cog.listener()
   async def on_ready(self):
+    if not CONFIG.TRACKING_ENABLED:
+      return
+
+    # Runs in the background so commands are served while stale players are brought up to date.
+    # on_ready fires again on reconnects, which reuses the running warm start
     logging.info("Initializing databases.")
-    await databases.initialize_dbs(directory)
+    databases.warm_start(directory)
+    # Keeps the tables current with the snapshots the updater writes while the bot runs
+    databases.start_scheduler()
+
+  def cog_unload(self):
+    asyncio.create_task(api.close())
+    databases.stop_scheduler()
+    databases.shutdown_pool()
 
   @commands.slash_command(integration_types = both_in if CONFIG.ALLOW_USER_INSTALLS else guild_in)
   async def map_username(self, ctx, minecraft_username):
-    uuid = getUUID(minecraft_username)
+    uuid = await getUUID(minecraft_username)
 
     if uuid is None:
       await ctx.reply(f"There was an error getting the UUID for {minecraft_username}. Are you sure you typed it correctly?")
@@ -64,21 +92,18 @@ class Util(commands.Cog):
 
 
 
-def getUUID(username):
+async def getUUID(username):
   """
   Gets the UUID of a Minecraft user. If the username is already a UUID, it returns the UUID.
   """
 
   if(len(username) == 32):
     return username
+  if(len(username) == 36 and username.count("-") == 4):
+    return username.replace("-", "")
 
   try:
-    d = datetime.datetime.now()
-    timestamp = calendar.timegm(d.utctimetuple())
-
-    url = "https://api.mojang.com/users/profiles/minecraft/{0}?at={1}".format(username, timestamp)
-    data = requests.get(url).json()
-    return data["id"]
+    return await api.fetch_uuid(username)
   except Exception as e:
     logging.error(e)
     logging.error(f"Error while getting uuid for {username}.")
@@ -111,11 +136,25 @@ def map_account(user: discord.User, uuid):
 
 # TODO write unmap account
 
+def no_data_message(uuid, message):
+  """Returns message for a command that found no tracking data, or says the player's tables are still being brought up to date."""
+  if databases.is_loading(uuid):
+    return "This player's tracking data is still loading. Please try again in a moment."
+  return message
+
+"""Days in each unit of a relative window like 7d or 2w."""
+WINDOW_UNITS = {"d": 1, "w": 7, "m": 30, "y": 365}
+
+def parse_window(text):
+  """Returns the timedelta of a relative window like 7d, 2w, 3m or 1y, or None if text is not one."""
+  match = re.fullmatch(r"\s*(\d+)\s*([dwmy])\s*", text or "", re.IGNORECASE)
+  if match is None:
+    return None
+  return datetime.timedelta(days=int(match[1]) * WINDOW_UNITS[match[2].lower()])
+
 def wins_to_prestige(wins):
   """Returns a tuple of prestige and the number of wins needed to reach it. For some modes, required wins have been halved and wins_to_prestige_havled should be used instead/"""
-  for wins_needed, prestige in prestiges:
-    wins_needed = wins_needed
-
+  for prestige, wins_needed in prestiges:
     if wins_needed > wins:
       return (prestige, wins_needed-wins)
   